@@ -0,0 +1,117 @@
+# bench_packet_in.py
+#
+# Microbenchmark do caminho quente do packet-in: quantos pacotes por segundo
+# o controlador consegue classificar (MACs, ethertype, "é QUIC-sim?")
+#
+#   antes:  ryu.lib.packet.Packet(data) + get_protocol(ipv4/udp)
+#   depois: packet_classifier.classify(data) (struct em offsets fixos)
+#
+# Uso:
+#   python bench_packet_in.py            (mistura: ARP, QUIC-sim, TCP, VLAN)
+#   BENCH_N=500000 BENCH_MIX=arp python bench_packet_in.py
+#
+# Sem o Ryu instalado, só o caminho novo é medido.
+
+from __future__ import annotations
+
+import os
+import struct
+import time
+
+from packet_classifier import IP_PROTO_UDP, classify
+
+BENCH_N = int(os.environ.get("BENCH_N", "200000"))
+BENCH_MIX = os.environ.get("BENCH_MIX", "all")  # all | arp | quic
+QUIC_UDP_PORT = 4433
+
+H1 = bytes.fromhex("000000000001")
+H2 = bytes.fromhex("000000000002")
+BCAST = b"\xff" * 6
+
+
+def ipv4_checksum(header: bytes) -> int:
+    total = sum(struct.unpack("!10H", header))
+    total = (total & 0xFFFF) + (total >> 16)
+    total = (total & 0xFFFF) + (total >> 16)
+    return ~total & 0xFFFF
+
+
+def ipv4_packet(proto: int, l4: bytes) -> bytes:
+    header = struct.pack("!BBHHHBBH4s4s", 0x45, 0, 20 + len(l4), 1, 0x4000, 64, proto, 0,
+                         bytes([10, 0, 0, 2]), bytes([10, 0, 0, 1]))
+    header = header[:10] + struct.pack("!H", ipv4_checksum(header)) + header[12:]
+    return header + l4
+
+
+def build_frames():
+    """Quadros de teste, como chegariam no msg.data de um packet-in."""
+    arp = (BCAST + H2 + struct.pack("!H", 0x0806)
+           + struct.pack("!HHBBH6s4s6s4s", 1, 0x0800, 6, 4, 1, H2, bytes([10, 0, 0, 2]),
+                         b"\x00" * 6, bytes([10, 0, 0, 1])))
+    payload = b"x" * 1200
+    udp_hdr = struct.pack("!HHHH", 40000, QUIC_UDP_PORT, 8 + len(payload), 0)
+    quic = H1 + H2 + struct.pack("!H", 0x0800) + ipv4_packet(17, udp_hdr + payload)
+    tcp_hdr = struct.pack("!HHIIBBHHH", 40000, 80, 1, 0, 0x50, 0x02, 65535, 0, 0)
+    tcp = H1 + H2 + struct.pack("!H", 0x0800) + ipv4_packet(6, tcp_hdr)
+    vlan = (H1 + H2 + struct.pack("!HH", 0x8100, 10) + struct.pack("!H", 0x0800)
+            + ipv4_packet(17, udp_hdr + payload))
+
+    if BENCH_MIX == "arp":
+        return [arp]
+    if BENCH_MIX == "quic":
+        return [quic]
+    return [arp, quic, tcp, vlan]
+
+
+def fast_path(data):
+    fields = classify(data)
+    quic = (fields.ip_proto == IP_PROTO_UDP
+            and QUIC_UDP_PORT in (fields.src_port, fields.dst_port))
+    return fields.eth_src, fields.eth_dst, fields.eth_type, quic
+
+
+def ryu_path(data):
+    from ryu.lib.packet import ethernet, ipv4, packet, udp  # já em sys.modules após main()
+    pkt = packet.Packet(data)
+    eth = pkt.get_protocol(ethernet.ethernet)
+    ip = pkt.get_protocol(ipv4.ipv4)
+    u = pkt.get_protocol(udp.udp) if ip is not None and ip.proto == 17 else None
+    quic = u is not None and QUIC_UDP_PORT in (u.src_port, u.dst_port)
+    return eth.src, eth.dst, eth.ethertype, quic
+
+
+def measure(name, func, frames):
+    n = len(frames)
+    start = time.perf_counter()
+    for i in range(BENCH_N):
+        func(frames[i % n])
+    elapsed = time.perf_counter() - start
+    rate = BENCH_N / elapsed
+    print("[BENCH] %-8s %9.0f packet-in/s (%.2f us/pacote)" % (name, rate, elapsed / BENCH_N * 1e6))
+    return rate
+
+
+def main():
+    frames = build_frames()
+    print("[BENCH] %d pacotes, mistura=%s" % (BENCH_N, BENCH_MIX))
+
+    after = measure("depois", fast_path, frames)
+
+    try:
+        import ryu.lib.packet  # noqa: F401
+    except ImportError:
+        print("[BENCH] Ryu não instalado: caminho antigo não medido")
+        return
+
+    # Os dois caminhos devem concordar nos campos usados (exceto ethertype
+    # com VLAN: o Ryu reporta 0x8100, o classificador o tipo interno)
+    for data in frames:
+        fast, slow = fast_path(data), ryu_path(data)
+        assert (fast[0], fast[1], fast[3]) == (slow[0], slow[1], slow[3]), (fast, slow)
+
+    before = measure("antes", ryu_path, frames)
+    print("[BENCH] ganho: %.1fx" % (after / before))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# mac_table.py
+#
+# Tabela de aprendizado MAC -> porta dos controladores (learning switch),
+# com memória limitada:
+#
+#   - MACs guardados como inteiros de 48 bits (não strings)
+#   - por switch, um OrderedDict MAC -> (instante << 16 | porta) em ordem de
+#     último aprendizado: o primeiro é sempre o mais antigo
+#   - envelhecimento: entradas não vistas há max_age s saem em expire()
+#     (a varredura só olha o começo de cada tabela); lookup() só as ignora
+#   - limite de max_per_switch entradas por switch: a menos recente sai (LRU),
+#     o que segura varreduras de MAC forjados
+#   - learn() avisa quando o host muda de porta, para o controlador apagar
+#     os fluxos antigos
+#
+# Não depende do Ryu.
+
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+PORT_BITS = 16
+PORT_MASK = (1 << PORT_BITS) - 1
+
+
+def mac_to_int(mac: str) -> int:
+    return int(mac.replace(":", ""), 16)
+
+
+def int_to_mac(value: int) -> str:
+    return value.to_bytes(6, "big").hex(":")
+
+
+class MacTable:
+    """dpid -> {MAC (int): porta}, com idade por entrada e tamanho limitado por switch."""
+
+    def __init__(self, max_per_switch: int = 4096, max_age: float = 300):
+        self.max_per_switch = max_per_switch
+        self.max_age = max_age
+        self._tables: Dict[int, "OrderedDict[int, int]"] = {}
+        # Contadores: entradas expulsas pelo limite, expiradas por idade e hosts que mudaram de porta
+        self.evictions = 0
+        self.expirations = 0
+        self.moves = 0
+
+    def __len__(self) -> int:
+        return sum(len(table) for table in self._tables.values())
+
+    def learn(self, dpid: int, mac: str, port: int, now: Optional[float] = None) -> Optional[int]:
+        """Aprende (ou renova) mac em port. Retorna a porta antiga se o host mudou de porta."""
+        if port > PORT_MASK:
+            # Portas reservadas (LOCAL, CONTROLLER...) não são aprendidas
+            return None
+        now = time.time() if now is None else now
+        table = self._tables.setdefault(dpid, OrderedDict())
+        key = mac_to_int(mac)
+
+        old = table.pop(key, None)
+        table[key] = (int(now) << PORT_BITS) | port
+        if len(table) > self.max_per_switch:
+            table.popitem(last=False)
+            self.evictions += 1
+
+        if old is not None and old & PORT_MASK != port:
+            self.moves += 1
+            return old & PORT_MASK
+        return None
+
+    def lookup(self, dpid: int, mac: str, now: Optional[float] = None) -> Optional[int]:
+        """
+        Porta onde mac foi visto por último no switch; None se desconhecido ou
+        expirado. Entrada expirada fica na tabela: só expire() remove, para o
+        controlador saber quais fluxos apagar.
+        """
+        table = self._tables.get(dpid)
+        if not table:
+            return None
+        value = table.get(mac_to_int(mac))
+        if value is None:
+            return None
+        now = time.time() if now is None else now
+        if now - (value >> PORT_BITS) > self.max_age:
+            return None
+        return value & PORT_MASK
+
+    def expire(self, now: Optional[float] = None) -> List[Tuple[int, str, int]]:
+        """Remove entradas mais velhas que max_age; retorna [(dpid, mac, porta), ...] removidas."""
+        now = time.time() if now is None else now
+        limit = now - self.max_age
+        removed = []
+        for dpid, table in self._tables.items():
+            while table:
+                key, value = next(iter(table.items()))
+                if (value >> PORT_BITS) >= limit:
+                    break
+                del table[key]
+                removed.append((dpid, int_to_mac(key), value & PORT_MASK))
+        self.expirations += len(removed)
+        return removed
+
+    def forget_switch(self, dpid: int):
+        self._tables.pop(dpid, None)
@@ -0,0 +1,83 @@
+# packet_classifier.py
+#
+# Classificador rápido de packet-in usado pelo simple_switch_final.py.
+#
+# O controlador só precisa de poucos campos de cada pacote (MACs, ethertype,
+# protocolo IP e portas UDP). Em vez de decodificar todas as camadas com
+# ryu.lib.packet (um objeto Python por protocolo), lê esses campos direto
+# dos bytes do msg.data em offsets fixos, com struct.unpack_from.
+#
+# Quadros incomuns (truncados, QinQ, cabeçalho IPv4 inválido) retornam None
+# e o controlador cai no parser completo do Ryu.
+#
+# Não depende do Ryu.
+
+from __future__ import annotations
+
+import struct
+from typing import NamedTuple, Optional
+
+ETH_TYPE_IP = 0x0800
+ETH_TYPE_ARP = 0x0806
+ETH_TYPE_VLAN = 0x8100
+ETH_TYPE_QINQ = 0x88A8
+ETH_TYPE_LLDP = 0x88CC
+
+IP_PROTO_TCP = 6
+IP_PROTO_UDP = 17
+
+# dst(6) src(6) ethertype(2)
+_ETH = struct.Struct("!6s6sH")
+# ver/ihl(1) tos(1) total_len(2) id(2) flags/frag(2) ttl(1) proto(1)
+_IPV4 = struct.Struct("!BxHHHxB")
+# portas de origem/destino (TCP e UDP começam igual)
+_PORTS = struct.Struct("!HH")
+
+
+class PacketFields(NamedTuple):
+    """Campos que o controlador usa de um packet-in (None quando não se aplicam)."""
+    eth_dst: str
+    eth_src: str
+    eth_type: int
+    ip_proto: Optional[int] = None
+    src_port: Optional[int] = None
+    dst_port: Optional[int] = None
+
+
+def classify(data) -> Optional[PacketFields]:
+    """
+    Extrai os campos de um quadro Ethernet (com no máximo uma tag 802.1Q).
+    Retorna None se o quadro precisa do parser completo.
+    """
+    if len(data) < _ETH.size:
+        return None
+    dst, src, eth_type = _ETH.unpack_from(data, 0)
+    offset = _ETH.size
+
+    if eth_type == ETH_TYPE_VLAN:
+        if len(data) < offset + 4:
+            return None
+        (eth_type,) = struct.unpack_from("!2xH", data, offset)
+        offset += 4
+    if eth_type in (ETH_TYPE_VLAN, ETH_TYPE_QINQ):
+        return None
+
+    eth_dst = dst.hex(":")
+    eth_src = src.hex(":")
+    if eth_type != ETH_TYPE_IP:
+        return PacketFields(eth_dst, eth_src, eth_type)
+
+    if len(data) < offset + 20:
+        return None
+    ver_ihl, total_len, _ident, frag, proto = _IPV4.unpack_from(data, offset)
+    ihl = (ver_ihl & 0x0F) * 4
+    if ver_ihl >> 4 != 4 or ihl < 20 or total_len < ihl:
+        return None
+
+    # Fragmento não inicial: não tem cabeçalho L4
+    l4 = offset + ihl
+    if frag & 0x1FFF or proto not in (IP_PROTO_TCP, IP_PROTO_UDP) or len(data) < l4 + 4:
+        return PacketFields(eth_dst, eth_src, eth_type, proto)
+
+    src_port, dst_port = _PORTS.unpack_from(data, l4)
+    return PacketFields(eth_dst, eth_src, eth_type, proto, src_port, dst_port)
@@ -0,0 +1,295 @@
+# routing_engine.py
+#
+# Motor de roteamento por menor caminho usado pelo simple_switch_final.py
+# (ROUTING=shortest), para qualquer topologia descoberta por LLDP:
+#
+#   - grafo de switches montado a partir dos enlaces descobertos (ryu.topology)
+#   - tabela de próximos saltos por destino: uma BFS a partir do switch de
+#     destino dá a distância de todos os switches e, para cada um, todos os
+#     vizinhos de custo mínimo (ECMP). Calculada sob demanda e guardada em cache.
+#   - mudança de enlace invalida só os destinos cujos caminhos mínimos mudam
+#   - k menores caminhos (Yen) para caminhos alternativos
+#   - árvore geradora (BFS) para flood sem laços
+#   - localização dos hosts (MAC -> switch/porta) aprendida nos packet-in
+#
+# Não depende do Ryu: trabalha só com dpids e números de porta.
+
+from __future__ import annotations
+
+import zlib
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# Caminho salto a salto: [(dpid, porta de saída), ...]
+Path = List[Tuple[int, int]]
+
+
+class RoutingEngine:
+    """Grafo de switches + cache de próximos saltos por destino."""
+
+    def __init__(self):
+        # dpid -> {vizinho: porta local que leva ao vizinho} (enlaces dirigidos)
+        self.adj: Dict[int, Dict[int, int]] = {}
+        # dpid -> {vizinho que chega neste switch: porta de saída do vizinho}
+        self.radj: Dict[int, Dict[int, int]] = {}
+        # dpid -> portas físicas do switch
+        self.ports: Dict[int, Set[int]] = {}
+        # dpid -> portas que já foram enlace entre switches; continuam fora das
+        # bordas mesmo com o enlace caído (não recebem flood nem hosts)
+        self.link_ports: Dict[int, Set[int]] = {}
+        # MAC -> (dpid, porta) onde o host está conectado
+        self.hosts: Dict[str, Tuple[int, int]] = {}
+
+        # destino -> (dist, next_hops)
+        #   dist:      {dpid: saltos até o destino}
+        #   next_hops: {dpid: [(vizinho, porta), ...]} todos de custo mínimo
+        self._tables: Dict[int, Tuple[Dict[int, int], Dict[int, List[Tuple[int, int]]]]] = {}
+        # (origem, destino, k) -> caminhos (listas de dpids)
+        self._k_paths: Dict[Tuple[int, int, int], List[List[int]]] = {}
+        # dpid -> portas de enlace na árvore geradora (None: recalcular)
+        self._tree: Optional[Dict[int, Set[int]]] = None
+
+        # quantas BFS completas foram feitas (para medir o efeito do cache)
+        self.recomputations = 0
+
+    # -----------------------------
+    # Topologia
+    # -----------------------------
+    def add_switch(self, dpid: int, ports: Iterable[int] = ()):
+        self.adj.setdefault(dpid, {})
+        self.radj.setdefault(dpid, {})
+        self.ports.setdefault(dpid, set()).update(ports)
+
+    def add_port(self, dpid: int, port_no: int):
+        self.ports.setdefault(dpid, set()).add(port_no)
+
+    def remove_switch(self, dpid: int):
+        for nbr in list(self.adj.get(dpid, {})):
+            self.remove_link(dpid, nbr)
+        for nbr in list(self.radj.get(dpid, {})):
+            self.remove_link(nbr, dpid)
+        self.adj.pop(dpid, None)
+        self.radj.pop(dpid, None)
+        self.ports.pop(dpid, None)
+        self.link_ports.pop(dpid, None)
+        self._tables.pop(dpid, None)
+        self._tree = None
+        self.hosts = {mac: loc for mac, loc in self.hosts.items() if loc[0] != dpid}
+
+    def add_link(self, src: int, src_port: int, dst: int) -> bool:
+        """Enlace dirigido src -> dst (o LLDP reporta cada sentido). True se mudou."""
+        self.add_switch(src, [src_port])
+        self.add_switch(dst)
+        if self.adj[src].get(dst) == src_port:
+            return False
+        # Mesmo vizinho por outra porta: troca o enlace antigo
+        self.remove_link(src, dst)
+
+        self._invalidate(src, dst, src_port, added=True)
+        self.adj[src][dst] = src_port
+        self.radj[dst][src] = src_port
+        self.link_ports.setdefault(src, set()).add(src_port)
+        # Porta de enlace não tem host: descarta localizações aprendidas nela
+        self.hosts = {mac: loc for mac, loc in self.hosts.items() if loc != (src, src_port)}
+        return True
+
+    def remove_link(self, src: int, dst: int) -> bool:
+        """Remove o enlace dirigido src -> dst. True se existia."""
+        if dst not in self.adj.get(src, {}):
+            return False
+        self._invalidate(src, dst, self.adj[src][dst], added=False)
+        del self.adj[src][dst]
+        del self.radj[dst][src]
+        return True
+
+    def _invalidate(self, src: int, dst: int, port: int, added: bool):
+        """
+        Atualiza só as tabelas que o enlace src -> dst altera:
+          - novo enlace de custo igual ao atual de src: vira mais um próximo
+            salto de src (distâncias não mudam); de custo menor: descarta
+          - enlace removido que era próximo salto de custo mínimo de src:
+            se src ainda tem outro de mesmo custo, só tira este; senão descarta
+        Tabelas descartadas são recalculadas na próxima consulta.
+        """
+        self._k_paths.clear()
+        self._tree = None
+        for target, (dist, next_hops) in list(self._tables.items()):
+            if dst not in dist:
+                continue
+            via = dist[dst] + 1
+            current = dist.get(src)
+            if added:
+                if current == via:
+                    next_hops[src].append((dst, port))
+                elif current is None or via < current:
+                    del self._tables[target]
+            elif current == via:
+                hops = next_hops[src]
+                if len(hops) > 1:
+                    hops.remove((dst, port))
+                else:
+                    del self._tables[target]
+
+    # -----------------------------
+    # Hosts
+    # -----------------------------
+    def is_link_port(self, dpid: int, port_no: int) -> bool:
+        """Porta de enlace entre switches (atual ou que já foi, com o enlace caído)."""
+        return port_no in self.link_ports.get(dpid, ())
+
+    def edge_ports(self, dpid: int) -> List[int]:
+        """Portas do switch que não são enlaces entre switches (onde há hosts)."""
+        links = self.link_ports.get(dpid, set())
+        return sorted(p for p in self.ports.get(dpid, ()) if p not in links)
+
+    def learn_host(self, mac: str, dpid: int, port_no: int) -> bool:
+        """Aprende (ou move) a localização do host. True se mudou de lugar."""
+        if self.is_link_port(dpid, port_no):
+            return False
+        old = self.hosts.get(mac)
+        self.hosts[mac] = (dpid, port_no)
+        return old is not None and old != (dpid, port_no)
+
+    # -----------------------------
+    # Caminhos
+    # -----------------------------
+    def table(self, target: int):
+        """(dist, next_hops) até o switch target, do cache ou por BFS reversa."""
+        cached = self._tables.get(target)
+        if cached is not None:
+            return cached
+
+        dist = {target: 0}
+        next_hops: Dict[int, List[Tuple[int, int]]] = {target: []}
+        queue = deque([target])
+        while queue:
+            node = queue.popleft()
+            for prev, port in self.radj.get(node, {}).items():
+                if prev not in dist:
+                    dist[prev] = dist[node] + 1
+                    next_hops[prev] = []
+                    queue.append(prev)
+                if dist[prev] == dist[node] + 1:
+                    next_hops[prev].append((node, port))
+
+        self.recomputations += 1
+        self._tables[target] = (dist, next_hops)
+        return dist, next_hops
+
+    def next_hops(self, dpid: int, target: int) -> List[Tuple[int, int]]:
+        return self.table(target)[1].get(dpid, [])
+
+    def path(self, src: int, dst: int, flow_key: str = "") -> Optional[Path]:
+        """
+        Caminho mínimo src -> dst como [(dpid, porta de saída), ...] (vazio se
+        src == dst). Entre próximos saltos de mesmo custo, escolhe por hash
+        de (flow_key, dpid): o mesmo fluxo sempre segue o mesmo caminho.
+        """
+        dist, next_hops = self.table(dst)
+        if src not in dist:
+            return None
+
+        path: Path = []
+        node = src
+        while node != dst:
+            hops = next_hops[node]
+            nbr, port = hops[zlib.crc32(f"{flow_key}:{node}".encode()) % len(hops)]
+            path.append((node, port))
+            node = nbr
+        return path
+
+    def host_path(self, src_dpid: int, dst_mac: str, flow_key: str = "") -> Optional[Path]:
+        """Caminho até o host dst_mac, incluindo a porta final do host; None se desconhecido."""
+        loc = self.hosts.get(dst_mac)
+        if loc is None:
+            return None
+        dst_dpid, host_port = loc
+        path = self.path(src_dpid, dst_dpid, flow_key)
+        if path is None:
+            return None
+        return path + [(dst_dpid, host_port)]
+
+    def k_shortest_paths(self, src: int, dst: int, k: int) -> List[List[int]]:
+        """Até k caminhos simples mais curtos (listas de dpids), algoritmo de Yen."""
+        key = (src, dst, k)
+        if key in self._k_paths:
+            return self._k_paths[key]
+
+        first = self._bfs_path(src, dst, set(), set())
+        paths = [first] if first else []
+        candidates: List[List[int]] = []
+        while paths and len(paths) < k:
+            prev = paths[-1]
+            for j in range(len(prev) - 1):
+                root = prev[:j + 1]
+                banned_edges = {(p[j], p[j + 1]) for p in paths if p[:j + 1] == root}
+                spur = self._bfs_path(prev[j], dst, set(root[:-1]), banned_edges)
+                if spur:
+                    candidate = root[:-1] + spur
+                    if candidate not in paths and candidate not in candidates:
+                        candidates.append(candidate)
+            if not candidates:
+                break
+            candidates.sort(key=len)
+            paths.append(candidates.pop(0))
+
+        self._k_paths[key] = paths
+        return paths
+
+    def _bfs_path(self, src, dst, banned_nodes, banned_edges) -> Optional[List[int]]:
+        if src not in self.adj or src in banned_nodes:
+            return None
+        parent = {src: None}
+        queue = deque([src])
+        while queue:
+            node = queue.popleft()
+            if node == dst:
+                path = []
+                while node is not None:
+                    path.append(node)
+                    node = parent[node]
+                return path[::-1]
+            for nbr in self.adj[node]:
+                if nbr in parent or nbr in banned_nodes or (node, nbr) in banned_edges:
+                    continue
+                parent[nbr] = node
+                queue.append(nbr)
+        return None
+
+    def spanning_tree(self) -> Dict[int, Set[int]]:
+        """
+        dpid -> portas de enlace que fazem parte da árvore geradora (BFS a
+        partir do menor dpid de cada componente). Só entram enlaces vistos
+        nos dois sentidos.
+        """
+        if self._tree is not None:
+            return self._tree
+
+        tree: Dict[int, Set[int]] = {dpid: set() for dpid in self.adj}
+        seen: Set[int] = set()
+        for root in sorted(self.adj):
+            if root in seen:
+                continue
+            seen.add(root)
+            queue = deque([root])
+            while queue:
+                node = queue.popleft()
+                for nbr, port in sorted(self.adj[node].items()):
+                    back = self.adj.get(nbr, {}).get(node)
+                    if nbr in seen or back is None:
+                        continue
+                    seen.add(nbr)
+                    tree[node].add(port)
+                    tree[nbr].add(back)
+                    queue.append(nbr)
+
+        self._tree = tree
+        return tree
+
+    def flood_ports(self, dpid: int) -> List[int]:
+        """Portas por onde um flood sai do switch: enlaces da árvore + portas de borda."""
+        return sorted(self.spanning_tree().get(dpid, set()) | set(self.edge_ports(dpid)))
+
+    def path_ports(self, dpids: List[int]) -> Path:
+        """Converte uma lista de dpids em [(dpid, porta de saída), ...]."""
+        return [(a, self.adj[a][b]) for a, b in zip(dpids, dpids[1:])]
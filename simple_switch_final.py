@@ -4,25 +4,46 @@
 # com suporte aos Experimentos 4 e 5 do enunciado:
 #
 #   - Exp. 4 (ECMP-sim): alterna dinamicamente entre s2 e s3
+#       ECMP_MODE=random: sorteio no controlador a cada re-instalação (hard_timeout)
+#       ECMP_MODE=select: grupo OFPGT_SELECT em s1/s4, hash por fluxo no switch
+#       ECMP_MODE=te: caminho menos carregado por fluxo, com rebalanceamento de elefantes
 #   - Exp. 5 (Falha de link): se link s1-s2 cair, redireciona para rota via s3
+#       FAILOVER_MODE=reactive: controlador reprograma as regras no OFPPortStatus
+#       FAILOVER_MODE=ff: grupos OFPGT_FF, o switch troca de caminho sozinho
+#   - ROUTING=shortest: menor caminho em qualquer topologia descoberta por
+#     LLDP (routing_engine.py), no lugar de DEFAULT_PORTS/learning-switch
+#   - PIPELINE=multi: tabelas ACL -> classificação -> encaminhamento por destino
+#   - FORWARDING=dst: uma regra por MAC de destino em cada switch e flood
+#     pela árvore geradora (tabelas pequenas, sem packet-in por conversa)
+#   - FLOOD_TREE=1: broadcast pela árvore geradora (grupo de flood por
+#     switch), sem laço no anel
 #
 # Requisito: manter as saídas (prints/logs) do QUIC-sim (cliente/servidor) inalteradas.
 # Este arquivo altera apenas decisões de encaminhamento no plano de dados.
 
 from __future__ import annotations
 
+import contextlib
 import os
 import random
-from typing import Dict, Optional, Tuple
+import time
+from typing import Dict, List, Optional, Tuple
 
 from ryu.base import app_manager
 from ryu.controller import ofp_event
 from ryu.controller.handler import CONFIG_DISPATCHER, MAIN_DISPATCHER, set_ev_cls
+from ryu.lib import hub
 from ryu.ofproto import ofproto_v1_3
 from ryu.lib.packet import packet
 from ryu.lib.packet import ethernet
 from ryu.lib.packet import ipv4
 from ryu.lib.packet import udp
+from ryu.topology import event as topo_event
+
+from mac_table import MacTable
+from packet_classifier import ETH_TYPE_LLDP, IP_PROTO_UDP, PacketFields, classify
+from routing_engine import Path, RoutingEngine
+from stats_collector import StatsCollector
 
 
 # -----------------------------
@@ -35,6 +56,197 @@ EXPERIMENT = int(os.environ.get("EXPERIMENT", "4"))
 
 QUIC_UDP_PORT = 4433
 
+# -----------------------------
+# ECMP (Exp. 4)
+# -----------------------------
+#   ECMP_MODE=random ryu-manager simple_switch_final.py
+#     o controlador sorteia s2/s3 a cada packet-in e a regra expira em
+#     ECMP_RANDOM_HARD_TIMEOUT s, forçando novo packet-in e novo sorteio
+#   ECMP_MODE=select ryu-manager simple_switch_final.py
+#     s1 e s4 recebem um grupo SELECT (um bucket por porta UP para s2/s3) e
+#     regras QUIC proativas; o switch escolhe o caminho por hash do fluxo e
+#     o controlador sai do caminho dos pacotes
+#   ECMP_WEIGHTS="3,1" pesos dos buckets (to_s2, to_s3) no modo select
+#   ECMP_MODE=te ryu-manager simple_switch_final.py
+#     engenharia de tráfego: cada fluxo QUIC-sim novo (porta UDP do cliente)
+#     ganha, na borda, uma regra própria pelo caminho menos carregado, medido
+#     pelos port stats (FLOW_STATS): maior utilização entre os enlaces do
+#     caminho + descartes na fila de saída. Os candidatos são os TE_K_PATHS
+#     menores caminhos (Yen, routing_engine.py) até o switch do destino, um
+#     por porta de saída. Quando a diferença entre o caminho mais e o menos
+#     carregado passa de TE_IMBALANCE (fração do mais carregado), um fluxo
+#     elefante (>= TE_ELEPHANT_BPS) é movido reescrevendo a sua regra.
+ECMP_MODE = os.environ.get("ECMP_MODE", "random")
+ECMP_WEIGHTS = tuple(int(w) for w in os.environ.get("ECMP_WEIGHTS", "1,1").split(","))
+ECMP_RANDOM_HARD_TIMEOUT = 1
+ECMP_GROUP_ID = 1
+
+TE_PRIORITY = 250
+TE_IDLE_TIMEOUT = 30
+TE_IMBALANCE = float(os.environ.get("TE_IMBALANCE", "0.3"))
+TE_ELEPHANT_BPS = float(os.environ.get("TE_ELEPHANT_BPS", "1e6"))
+TE_K_PATHS = int(os.environ.get("TE_K_PATHS", "2"))
+# Carga estimada de um fluxo recém-alocado até a próxima amostra da porta
+# (evita mandar uma rajada de fluxos novos todos para o mesmo caminho)
+TE_NEW_FLOW_BPS = 1e6
+# Cada pacote descartado por s na porta pesa como esta quantidade de bps
+TE_DROP_PENALTY_BITS = 12000 * 10
+# Um fluxo movido fica TE_HOLD s sem poder ser movido de novo
+TE_HOLD = 10
+
+# -----------------------------
+# Failover (Exp. 5)
+# -----------------------------
+#   FAILOVER_MODE=reactive ryu-manager simple_switch_final.py
+#     no OFPPortStatus do link s1-s2, o controlador apaga e reinstala as
+#     regras QUIC em todos os switches (1 RTT do controlador + flow-mods)
+#   FAILOVER_MODE=ff ryu-manager simple_switch_final.py
+#     grupos OFPGT_FF pré-instalados em s1, s2 e s4: bucket primário via s2 e
+#     backup via s3, cada um vigiando a própria porta (watch_port). Quando a
+#     porta cai, o switch passa para o próximo bucket sem falar com o
+#     controlador; o controlador só reconcilia os grupos depois.
+FAILOVER_MODE = os.environ.get("FAILOVER_MODE", "reactive")
+FF_GROUP_S2C = 11   # h1 -> h2 (servidor -> cliente)
+FF_GROUP_C2S = 12   # h2 -> h1 (cliente -> servidor)
+
+# -----------------------------
+# Roteamento
+# -----------------------------
+#   ROUTING=static (padrão): DEFAULT_PORTS + learning-switch, como nos experimentos
+#   ROUTING=shortest ryu-manager --observe-links simple_switch_final.py
+#     grafo montado pela descoberta LLDP; no 1º packet-in de um par de hosts
+#     o caminho mínimo inteiro é instalado (match eth_src/eth_dst). Destino
+#     desconhecido vai só para as portas de borda (sem flood entre switches,
+#     então sem tempestade em malhas com laços). Sem enlaces descobertos,
+#     cai no modo static.
+ROUTING = os.environ.get("ROUTING", "static")
+ROUTE_PRIORITY = 100
+
+# Encaminhamento fora do QUIC-sim:
+#   FORWARDING=learning (padrão): learning-switch, uma regra por
+#     (in_port, src, dst) instalada a cada par novo
+#   FORWARDING=dst: uma regra por MAC de destino em cada switch (prioridade
+#     DST_PRIORITY), instalada em todos os switches assim que o host é
+#     localizado, pelo menor caminho até ele. Conversa nova com host
+#     conhecido não passa pelo controlador. Destino desconhecido/broadcast
+#     sai só pelas portas da árvore geradora (sem laço no anel).
+#     Como o tráfego não passa mais pelo controlador, o host não é envelhecido
+#     pela tabela MAC: a regra no switch de borda do host tem idle_timeout
+#     DST_IDLE_TIMEOUT e, quando expira (FLOW_REMOVED), o host é esquecido e
+#     as regras dele saem de todos os switches.
+FORWARDING = os.environ.get("FORWARDING", "learning")
+DST_PRIORITY = 90
+DST_IDLE_TIMEOUT = int(os.environ.get("DST_IDLE_TIMEOUT", "300"))
+
+# Broadcast sem laço (FLOOD_TREE=1, padrão): com a topologia descoberta por
+# LLDP, cada switch recebe um grupo OFPGT_ALL (FLOOD_GROUP_ID) com as portas
+# da árvore geradora + bordas, e broadcast/multicast sai pelo grupo no próprio
+# switch (prioridade FLOOD_PRIORITY). Nas portas de borda vai também uma cópia
+# ao controlador, para aprender o host. O OpenFlow 1.3 não tem mais
+# OFPPC_NO_FLOOD: portas fora da árvore simplesmente não estão no grupo.
+# A árvore é refeita a cada mudança de enlace/porta e só os switches cujo
+# conjunto de portas mudou são reprogramados. Sem enlaces conhecidos, o
+# flood continua por OFPP_FLOOD.
+FLOOD_TREE = os.environ.get("FLOOD_TREE", "1") == "1"
+FLOOD_GROUP_ID = 20
+FLOOD_PRIORITY = 80
+
+# Caminhos fim a fim (nos dois modos de ROUTING): os flow-mods do caminho vão
+# em lote, do switch de egresso para o de ingresso, seguidos de um barrier
+# por switch; o pacote só é liberado no ingresso quando todos confirmam (ou
+# após BARRIER_TIMEOUT s, se algum switch não responder).
+BARRIER_TIMEOUT = 1.0
+
+# Lotes de flow-mods (flow_batch): dentro de um lote, add_flow/del_flow/
+# send_group só enfileiram por datapath; no fim, mensagens redundantes são
+# descartadas e cada switch recebe a fila numa bundle ONF (extensão do
+# OF1.3, aplicada de forma atômica) seguida de um barrier. Sem suporte a
+# bundles (no Ryu ou no switch, que responde com erro), vai só com o barrier.
+FLOW_BUNDLES = os.environ.get("FLOW_BUNDLES", "1") == "1"
+
+# Cookies: toda regra instalada leva no cookie a política que a criou (8 bits
+# altos) e a geração dessa política (24 bits seguintes). Os 32 bits baixos
+# identificam um fluxo individual (regras do modo te). Remoções usam
+# cookie/máscara em vez de matches amplos, então só apagam as regras da
+# própria política. Reprogramar é "make-before-break": a nova geração é
+# instalada (e confirmada por barrier) antes de apagar a geração antiga.
+COOKIE_POLICY_SHIFT = 56
+COOKIE_GEN_SHIFT = 32
+COOKIE_POLICY_MASK = 0xFF << COOKIE_POLICY_SHIFT
+COOKIE_GEN_MASK = 0xFFFFFF << COOKIE_GEN_SHIFT
+
+POLICY_TABLE_MISS = 1
+POLICY_LEARNING = 2
+POLICY_QUIC = 3
+POLICY_ROUTE = 4
+POLICY_PUNT = 5
+POLICY_PIPELINE = 6
+POLICY_DST = 7
+POLICY_FLOOD = 8
+
+# Pipeline OpenFlow:
+#   PIPELINE=single (padrão): tudo na tabela 0, separado por prioridade
+#     (0 table-miss, 1 learning, 100 caminhos, 200/300 QUIC, 400 drop)
+#   PIPELINE=multi: três tabelas ligadas por goto_table
+#     TABLE_ACL (0)      segurança: drops da proteção de punt; o resto segue
+#     TABLE_CLASSIFY (1) marca QUIC-sim (UDP 4433, qualquer sentido) no
+#                        metadata (META_QUIC) e segue
+#     TABLE_FORWARD (2)  encaminhamento só por destino: eth_dst (+ META_QUIC
+#                        para as políticas QUIC); table-miss -> controlador
+#   Cada política fica na sua tabela e é atualizada sem tocar nas outras; as
+#   regras por par (src, dst) viram uma por destino.
+PIPELINE = os.environ.get("PIPELINE", "single")
+TABLE_ACL = 0
+TABLE_CLASSIFY = 1
+TABLE_FORWARD = 2
+META_QUIC = 0x1
+
+# Proteção de punt (packet-ins para o controlador), PUNT_PROTECTION=1:
+#   - a table-miss passa por um meter OF1.3 que limita os packet-ins do
+#     switch inteiro a PUNT_METER_RATE pacotes/s (o excesso é descartado no switch)
+#   - no controlador, token bucket por (dpid, in_port, MAC de origem):
+#     PUNT_RATE packet-ins/s com rajada de PUNT_BURST
+#   - quem estoura o bucket numa porta de borda ganha uma regra de drop
+#     (prioridade PUNT_DROP_PRIORITY) por PUNT_BLOCK_TIME s
+# Contadores punt_admitted/punt_dropped/punt_blocks no [STATS] e descartes
+# do meter no [PUNT]. Switch sem suporte a meters fica só com os buckets.
+PUNT_PROTECTION = os.environ.get("PUNT_PROTECTION", "1") == "1"
+PUNT_METER_ID = 1
+PUNT_METER_RATE = int(os.environ.get("PUNT_METER_RATE", "1000"))
+PUNT_METER_BURST = 200
+PUNT_RATE = float(os.environ.get("PUNT_RATE", "100"))
+PUNT_BURST = 200
+PUNT_BLOCK_TIME = 10
+PUNT_DROP_PRIORITY = 400
+
+# Packet-in em workers: o handler do evento só enfileira; PACKET_IN_WORKERS
+# green threads processam as filas (decisão de caminho/política, flow-mods,
+# packet-out). A fila é escolhida pelo dpid, então os packet-ins de um mesmo
+# switch são tratados em ordem por um único worker. Fila cheia
+# (PACKET_IN_QUEUE_MAX) descarta o packet-in. PACKET_IN_WORKERS=0 trata
+# direto no handler, como antes. Profundidade das filas no [STATS].
+PACKET_IN_WORKERS = int(os.environ.get("PACKET_IN_WORKERS", "4"))
+PACKET_IN_QUEUE_MAX = int(os.environ.get("PACKET_IN_QUEUE_MAX", "1000"))
+
+# Tabela de aprendizado (mac_table.py): até MAC_TABLE_SIZE MACs por switch
+# (o menos recente sai) e entradas não vistas há MAC_AGING_TIME s expiram,
+# junto com os fluxos do learning-switch para elas
+MAC_TABLE_SIZE = int(os.environ.get("MAC_TABLE_SIZE", "4096"))
+MAC_AGING_TIME = int(os.environ.get("MAC_AGING_TIME", "300"))
+
+# Coleta de contadores (stats_collector.py), FLOW_STATS=1: flow stats e port
+# stats de cada switch, taxas por fluxo/enlace e matriz de tráfego (src, dst)
+# com histórico. Intervalo por switch entre STATS_POLL_MIN e STATS_POLL_MAX s:
+# volta ao mínimo quando alguma porta passa de STATS_BUSY_BPS, dobra quando ociosa.
+FLOW_STATS = os.environ.get("FLOW_STATS", "1") == "1"
+STATS_POLL_MIN = float(os.environ.get("STATS_POLL_MIN", "1"))
+STATS_POLL_MAX = float(os.environ.get("STATS_POLL_MAX", "16"))
+STATS_BUSY_BPS = float(os.environ.get("STATS_BUSY_BPS", "1e6"))
+STATS_HISTORY = 60
+
+# Intervalo (s) do log de contadores do controlador (packet-in, flow-mod, group-mod)
+STATS_INTERVAL = int(os.environ.get("STATS_INTERVAL", "10"))
+
 # MACs padrão quando Mininet é executado com "--mac"
 H1_MAC = os.environ.get("H1_MAC", "00:00:00:00:00:01")
 H2_MAC = os.environ.get("H2_MAC", "00:00:00:00:00:02")
@@ -71,6 +283,17 @@ DEFAULT_PORTS = {
     4: {"to_s2": 1, "to_s3": 2, "to_h2": 3},
 }
 
+# Switches de borda -> MAC do host local (onde o ECMP escolhe o caminho)
+ECMP_EDGES = {1: H1_MAC, 4: H2_MAC}
+
+# (dpid, MAC de origem) -> grupo fast failover usado pelo QUIC-sim (Exp. 5)
+FF_GROUPS = {
+    (1, H1_MAC): FF_GROUP_S2C,
+    (2, H1_MAC): FF_GROUP_S2C,
+    (2, H2_MAC): FF_GROUP_C2S,
+    (4, H2_MAC): FF_GROUP_C2S,
+}
+
 
 class SimpleSwitch13(app_manager.RyuApp):
     # Usaremos OpenFlow 1.3
@@ -79,8 +302,8 @@ class SimpleSwitch13(app_manager.RyuApp):
     def __init__(self, *args, **kwargs):
         super(SimpleSwitch13, self).__init__(*args, **kwargs)
 
-        # Tabela: dpid -> {mac: porta} (learning switch)
-        self.mac_to_port: Dict[int, Dict[str, int]] = {}
+        # Tabela: dpid -> {mac: porta} (learning switch), limitada e com envelhecimento
+        self.mac_table = MacTable(MAC_TABLE_SIZE, MAC_AGING_TIME)
 
         # Estado de portas (para Exp. 5): (dpid, port_no) -> True (up) / False (down)
         # Se não houver informação de status, assumimos UP.
@@ -89,39 +312,1073 @@ class SimpleSwitch13(app_manager.RyuApp):
         # Portas por switch (pode ser ajustado via env, se necessário)
         self.ports = DEFAULT_PORTS
 
-        self.logger.info("== Controlador iniciado (EXPERIMENT=%s) ==", EXPERIMENT)
+        # Contadores para comparar os modos de ECMP: total e último log
+        self.counters: Dict[str, int] = {
+            "packet_in": 0, "flow_mod": 0, "group_mod": 0,
+            "barrier": 0, "bundle": 0, "coalesced": 0, "slow_parse": 0,
+            "punt_admitted": 0, "punt_dropped": 0, "punt_blocks": 0,
+            "pi_queued": 0, "pi_queue_drops": 0,
+        }
+        self.counters_last: Dict[str, int] = dict(self.counters)
+        self.counters_time = time.time()
+
+        # Datapaths conectados (para reprogramar regras/grupos de outros switches)
+        self.datapaths: Dict[int, object] = {}
+
+        # (dpid, group_id) já criados (ADD na 1ª vez, MODIFY depois)
+        self.groups: set = set()
+        # dpid -> portas do grupo de flood instalado (FLOOD_TREE)
+        self.flood_sets: Dict[int, Tuple[int, ...]] = {}
+
+        # Política -> geração atual (vai no cookie das regras novas)
+        self.generations: Dict[int, int] = {}
+
+        # ECMP_MODE=te: cookie -> fluxo alocado; (dpid, src, dst, porta do cliente) -> cookie;
+        # carga estimada dos fluxos novos por porta até a próxima amostra
+        self.te_flows: Dict[int, dict] = {}
+        self.te_index: Dict[Tuple[int, str, str, int], int] = {}
+        self.te_pending: Dict[Tuple[int, int], float] = {}
+        self.next_flow_id = 1
+
+        # Proteção de punt: (dpid, in_port, src) -> [tokens, último packet-in];
+        # mesma chave -> instante em que a regra de drop expira
+        self.punt_buckets: Dict[Tuple[int, int, str], List[float]] = {}
+        self.punt_blocked: Dict[Tuple[int, int, str], float] = {}
+        self.no_meters: set = set()
+
+        # ROUTING=shortest: grafo/caminhos e caminhos instalados por (src, dst)
+        self.routing = RoutingEngine()
+        self.installed_paths: Dict[Tuple[str, str], List[Tuple[int, int]]] = {}
+        # Lote aberto (flow_batch), filas por datapath e profundidade de aninhamento
+        self.batch: Optional[dict] = None
+        self.batch_depth = 0
+        self.flow_queues: Dict[int, List] = {}
+        # (dpid, xid) do barrier -> lote que espera por ele
+        self.pending_barriers: Dict[Tuple[int, int], dict] = {}
+        # (dpid, xid do OPEN, de cada ADD ou do COMMIT da bundle) -> bundle pendente
+        # {"msgs", "batch", "keys", "open"}, para reenviar sem bundle se o switch recusar
+        self.open_bundles: Dict[Tuple[int, int], dict] = {}
+        self.no_bundles: set = set()
+        self.next_bundle_id = 1
+
+        # Sem LLDP (ROUTING=static), o grafo vem de DEFAULT_PORTS
+        if ROUTING == "static":
+            self._seed_static_topology()
+
+        self.logger.info("== Controlador iniciado (EXPERIMENT=%s, ECMP_MODE=%s, ROUTING=%s) ==",
+                         EXPERIMENT, ECMP_MODE, ROUTING)
+        self.monitor_thread = hub.spawn(self._monitor)
+
+        # Taxas por fluxo/enlace e matriz de tráfego a partir dos contadores dos switches
+        self.collector = StatsCollector(STATS_POLL_MIN, STATS_POLL_MAX, STATS_BUSY_BPS, STATS_HISTORY)
+        if FLOW_STATS:
+            self.stats_thread = hub.spawn(self._poll_stats)
+
+        # Filas de packet-in por worker e maior profundidade vista desde o último [STATS]
+        self.pi_queues = [hub.Queue() for _ in range(PACKET_IN_WORKERS)]
+        self.pi_queue_peak = [0] * PACKET_IN_WORKERS
+        self.pi_threads = [hub.spawn(self._packet_in_worker, i) for i in range(PACKET_IN_WORKERS)]
 
     # -----------------------------
     # Utilitários
     # -----------------------------
-    def add_flow(self, datapath, priority, match, actions, buffer_id=None):
-        """Instala uma regra de fluxo no switch."""
+    def add_flow(self, datapath, priority, match, actions, buffer_id=None, hard_timeout=0, cookie=0,
+                 meter_id=None, idle_timeout=0, table_id=None, goto_table=None, metadata=None,
+                 flags=0):
+        """
+        Instala uma regra de fluxo no switch (cookie: ver self._cookie).
+        Sem table_id, a tabela vem da política do cookie (ver _table_for).
+        metadata=(valor, máscara) grava o metadata; goto_table segue o pipeline.
+        """
         ofproto = datapath.ofproto
         parser = datapath.ofproto_parser
+        if table_id is None:
+            table_id = self._table_for(cookie)
 
-        inst = [parser.OFPInstructionActions(ofproto.OFPIT_APPLY_ACTIONS, actions)]
+        inst = []
+        if meter_id is not None:
+            inst.append(parser.OFPInstructionMeter(meter_id, ofproto.OFPIT_METER))
+        if actions or goto_table is None:
+            inst.append(parser.OFPInstructionActions(ofproto.OFPIT_APPLY_ACTIONS, actions))
+        if metadata is not None:
+            inst.append(parser.OFPInstructionWriteMetadata(*metadata))
+        if goto_table is not None:
+            inst.append(parser.OFPInstructionGotoTable(goto_table))
 
         if buffer_id is not None:
             mod = parser.OFPFlowMod(
                 datapath=datapath,
+                table_id=table_id,
                 buffer_id=buffer_id,
+                cookie=cookie,
                 priority=priority,
                 match=match,
                 instructions=inst,
+                idle_timeout=idle_timeout,
+                hard_timeout=hard_timeout,
+                flags=flags,
             )
         else:
             mod = parser.OFPFlowMod(
                 datapath=datapath,
+                table_id=table_id,
+                cookie=cookie,
                 priority=priority,
                 match=match,
                 instructions=inst,
+                idle_timeout=idle_timeout,
+                hard_timeout=hard_timeout,
+                flags=flags,
+            )
+
+        self._send(datapath, mod)
+
+    def del_flow(self, datapath, match=None, cookie=0, cookie_mask=0):
+        """Remove flows que casam com o match e cujo cookie casa com cookie/cookie_mask (DELETE)."""
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        mod = parser.OFPFlowMod(
+            datapath=datapath,
+            table_id=ofproto.OFPTT_ALL,
+            cookie=cookie,
+            cookie_mask=cookie_mask,
+            command=ofproto.OFPFC_DELETE,
+            out_port=ofproto.OFPP_ANY,
+            out_group=ofproto.OFPG_ANY,
+            match=match if match is not None else parser.OFPMatch(),
+        )
+        self._send(datapath, mod)
+
+    def _cookie(self, policy: int, generation: Optional[int] = None) -> int:
+        """Cookie de uma regra: política + geração (a atual, se não informada)."""
+        if generation is None:
+            generation = self.generations.get(policy, 0)
+        return (policy << COOKIE_POLICY_SHIFT) | ((generation & 0xFFFFFF) << COOKIE_GEN_SHIFT)
+
+    def _table_for(self, cookie: int) -> int:
+        """Tabela da regra pela política do cookie: com PIPELINE=multi, drops na ACL e o resto no encaminhamento."""
+        if PIPELINE != "multi":
+            return 0
+        if cookie >> COOKIE_POLICY_SHIFT == POLICY_PUNT:
+            return TABLE_ACL
+        return TABLE_FORWARD
+
+    def _install_pipeline(self, datapath):
+        """PIPELINE=multi: regras fixas da ACL e da classificação (a table-miss fica no encaminhamento)."""
+        parser = datapath.ofproto_parser
+        cookie = self._cookie(POLICY_PIPELINE)
+
+        self.add_flow(datapath, 0, parser.OFPMatch(), [], cookie=cookie,
+                      table_id=TABLE_ACL, goto_table=TABLE_CLASSIFY)
+
+        for udp_port in ({"udp_dst": QUIC_UDP_PORT}, {"udp_src": QUIC_UDP_PORT}):
+            match = parser.OFPMatch(eth_type=0x0800, ip_proto=17, **udp_port)
+            self.add_flow(datapath, 10, match, [], cookie=cookie, table_id=TABLE_CLASSIFY,
+                          metadata=(META_QUIC, META_QUIC), goto_table=TABLE_FORWARD)
+        self.add_flow(datapath, 0, parser.OFPMatch(), [], cookie=cookie,
+                      table_id=TABLE_CLASSIFY, goto_table=TABLE_FORWARD)
+
+    def _learning_match(self, parser, in_port: int, src: str, dst: str):
+        """Regra do learning-switch: por (in_port, src, dst), ou só por destino com PIPELINE=multi."""
+        if PIPELINE == "multi":
+            return parser.OFPMatch(eth_dst=dst)
+        return parser.OFPMatch(in_port=in_port, eth_dst=dst, eth_src=src)
+
+    def _route_match(self, parser, src: str, dst: str):
+        """Regra de caminho fim a fim: por (src, dst), ou só por destino com PIPELINE=multi."""
+        if PIPELINE == "multi":
+            return parser.OFPMatch(eth_dst=dst)
+        return parser.OFPMatch(eth_src=src, eth_dst=dst)
+
+    def _del_policy(self, datapath, policy: int, generation: Optional[int] = None, match=None):
+        """Remove as regras da política (só de uma geração, se informada)."""
+        if generation is None:
+            cookie, mask = self._cookie(policy, 0), COOKIE_POLICY_MASK
+        else:
+            cookie, mask = self._cookie(policy, generation), COOKIE_POLICY_MASK | COOKIE_GEN_MASK
+        self.del_flow(datapath, match, cookie=cookie, cookie_mask=mask)
+
+    def _next_generation(self, policy: int) -> int:
+        """Abre uma nova geração da política; retorna a anterior."""
+        old = self.generations.get(policy, 0)
+        self.generations[policy] = (old + 1) & 0xFFFFFF
+        return old
+
+    def send_group(self, datapath, group_type, group_id, buckets):
+        """Cria o grupo no switch ou, se já existe, substitui os buckets."""
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+
+        key = (datapath.id, group_id)
+        command = ofproto.OFPGC_MODIFY if key in self.groups else ofproto.OFPGC_ADD
+        mod = parser.OFPGroupMod(datapath, command, group_type, group_id, buckets)
+        self._send(datapath, mod)
+        self.groups.add(key)
+
+    def _reset_groups(self, datapath):
+        """Switch (re)conectado: apaga grupos antigos para recriá-los com ADD."""
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+
+        mod = parser.OFPGroupMod(datapath, ofproto.OFPGC_DELETE, 0, ofproto.OFPG_ALL)
+        self._send(datapath, mod)
+        self.groups = {key for key in self.groups if key[0] != datapath.id}
+        self.flood_sets.pop(datapath.id, None)
+
+    # -----------------------------
+    # Proteção de punt
+    # -----------------------------
+    def _punt_meter_enabled(self, datapath) -> bool:
+        return PUNT_PROTECTION and datapath.id not in self.no_meters
+
+    def _install_punt_meter(self, datapath):
+        """
+        Switch (re)conectado: recria o meter de punt do zero. Vai direto ao
+        switch, fora de lote, seguido de barrier: o OVS não aceita meter mod
+        dentro de bundle, e as regras com meter só vêm depois.
+        """
+        if not self._punt_meter_enabled(datapath):
+            return
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+
+        datapath.send_msg(parser.OFPMeterMod(datapath, command=ofproto.OFPMC_DELETE,
+                                             meter_id=ofproto.OFPM_ALL))
+        band = parser.OFPMeterBandDrop(rate=PUNT_METER_RATE, burst_size=PUNT_METER_BURST)
+        datapath.send_msg(parser.OFPMeterMod(
+            datapath, command=ofproto.OFPMC_ADD,
+            flags=ofproto.OFPMF_PKTPS | ofproto.OFPMF_BURST | ofproto.OFPMF_STATS,
+            meter_id=PUNT_METER_ID, bands=[band]))
+        datapath.send_msg(parser.OFPBarrierRequest(datapath))
+        self.counters["barrier"] += 1
+
+    def _install_table_miss(self, datapath):
+        """Table-miss para o controlador, limitada pelo meter de punt quando há suporte."""
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+
+        meter_id = PUNT_METER_ID if self._punt_meter_enabled(datapath) else None
+        match = parser.OFPMatch()
+        actions = [parser.OFPActionOutput(ofproto.OFPP_CONTROLLER,
+                                          ofproto.OFPCML_NO_BUFFER)]
+        self.add_flow(datapath, 0, match, actions, cookie=self._cookie(POLICY_TABLE_MISS),
+                      meter_id=meter_id)
+
+    def _punt_admit(self, datapath, in_port: int, src: str) -> bool:
+        """
+        Token bucket por (dpid, in_port, src). False: packet-in descartado;
+        se for porta de borda, a origem ganha uma regra de drop temporária.
+        """
+        now = time.time()
+        key = (datapath.id, in_port, src)
+        bucket = self.punt_buckets.get(key)
+        if bucket is None:
+            bucket = self.punt_buckets[key] = [PUNT_BURST, now]
+
+        tokens = min(PUNT_BURST, bucket[0] + (now - bucket[1]) * PUNT_RATE)
+        bucket[1] = now
+        if tokens >= 1:
+            bucket[0] = tokens - 1
+            self.counters["punt_admitted"] += 1
+            return True
+        bucket[0] = tokens
+        self.counters["punt_dropped"] += 1
+
+        # Em porta entre switches o MAC é de outro lugar: não bloqueia o enlace
+        if self.punt_blocked.get(key, 0) <= now and not self.routing.is_link_port(*key[:2]):
+            self.punt_blocked[key] = now + PUNT_BLOCK_TIME
+            self.counters["punt_blocks"] += 1
+            self.logger.info("[PUNT] dpid=%s port=%s src=%s excedeu %.0f packet-in/s; drop por %ds",
+                             datapath.id, in_port, src, PUNT_RATE, PUNT_BLOCK_TIME)
+            parser = datapath.ofproto_parser
+            match = parser.OFPMatch(in_port=in_port, eth_src=src)
+            self.add_flow(datapath, PUNT_DROP_PRIORITY, match, [],
+                          hard_timeout=PUNT_BLOCK_TIME, cookie=self._cookie(POLICY_PUNT))
+        return False
+
+    def _prune_punt_state(self, now: float):
+        """Esquece buckets cheios (parados há tempo suficiente para encher) e bloqueios expirados."""
+        idle = PUNT_BURST / max(PUNT_RATE, 1e-9)
+        self.punt_buckets = {k: b for k, b in self.punt_buckets.items() if now - b[1] < idle}
+        self.punt_blocked = {k: t for k, t in self.punt_blocked.items() if t > now}
+
+    # -----------------------------
+    # Lotes de flow-mods
+    # -----------------------------
+    def _send(self, datapath, msg):
+        """Envia a mensagem já ou, dentro de um flow_batch, enfileira para o datapath."""
+        if self.batch_depth:
+            self.flow_queues.setdefault(datapath.id, []).append(msg)
+            return
+        self._count(msg)
+        datapath.send_msg(msg)
+
+    def _count(self, msg):
+        name = type(msg).__name__
+        if name == "OFPFlowMod":
+            self.counters["flow_mod"] += 1
+        elif name == "OFPGroupMod":
+            self.counters["group_mod"] += 1
+
+    @contextlib.contextmanager
+    def flow_batch(self, name="lote", on_done=None, order=()):
+        """
+        Agrupa as mensagens enviadas no bloco. No fim do lote mais externo,
+        cada switch recebe a sua fila (na ordem de dpids de order, depois o
+        resto) e on_done roda quando todos confirmarem com barrier.
+        Lotes aninhados entram no lote externo.
+        """
+        if self.batch_depth == 0:
+            self.batch = {"name": name, "callbacks": [], "order": list(order),
+                          "waiting": set(), "bundles": [], "done": False,
+                          "start": time.time()}
+        if on_done is not None:
+            self.batch["callbacks"].append(on_done)
+        self.batch_depth += 1
+        try:
+            yield self.batch
+        finally:
+            self.batch_depth -= 1
+            if self.batch_depth == 0:
+                batch, self.batch = self.batch, None
+                self._commit_batch(batch)
+
+    def _commit_batch(self, batch):
+        queues, self.flow_queues = self.flow_queues, {}
+        dpids = batch["order"] + [dpid for dpid in queues if dpid not in batch["order"]]
+        for dpid in dpids:
+            datapath = self.datapaths.get(dpid)
+            msgs = queues.get(dpid)
+            if datapath is None or not msgs:
+                continue
+            self._write_batch(datapath, self._coalesce(datapath, msgs), batch)
+
+        if batch["waiting"]:
+            hub.spawn_after(BARRIER_TIMEOUT, self._release_batch, batch, "timeout")
+        else:
+            self._release_batch(batch)
+
+    def _coalesce(self, datapath, msgs):
+        """
+        Descarta mensagens que o próprio lote torna inúteis, mantendo a ordem:
+          - flow ADD repetido (mesma tabela/prioridade/match): vale o último
+          - flow ADD seguido de DELETE do mesmo match: some o ADD
+          - group ADD/MODIFY repetido: vale o último (como ADD, se o 1º era ADD)
+        """
+        ofproto = datapath.ofproto
+        out = []
+        index = {}
+        for msg in msgs:
+            name = type(msg).__name__
+            if name == "OFPFlowMod":
+                key = ("flow", msg.table_id, msg.priority, str(msg.match))
+                if msg.command == ofproto.OFPFC_ADD:
+                    if key in index:
+                        out[index[key]] = None
+                    index[key] = len(out)
+                elif msg.command in (ofproto.OFPFC_DELETE, ofproto.OFPFC_DELETE_STRICT):
+                    for k in [k for k in index if k[0] == "flow" and k[3] == key[3]]:
+                        added = out[index[k]]
+                        if (added.cookie ^ msg.cookie) & msg.cookie_mask:
+                            continue
+                        if msg.command == ofproto.OFPFC_DELETE or k[2] == msg.priority:
+                            out[index.pop(k)] = None
+            elif name == "OFPGroupMod":
+                key = ("group", msg.group_id)
+                prev = index.pop(key, None)
+                if (prev is not None and msg.command != ofproto.OFPGC_DELETE
+                        and out[prev].command != ofproto.OFPGC_DELETE):
+                    if out[prev].command == ofproto.OFPGC_ADD:
+                        msg.command = ofproto.OFPGC_ADD
+                    out[prev] = None
+                index[key] = len(out)
+            out.append(msg)
+
+        result = [msg for msg in out if msg is not None]
+        self.counters["coalesced"] += len(msgs) - len(result)
+        return result
+
+    def _write_batch(self, datapath, msgs, batch):
+        """Escreve a fila do switch numa bundle ONF (ou solta) e fecha com barrier."""
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+
+        use_bundle = (FLOW_BUNDLES and len(msgs) > 1 and datapath.id not in self.no_bundles
+                      and hasattr(parser, "ONFBundleCtrlMsg"))
+        if use_bundle:
+            bundle_id = self.next_bundle_id
+            self.next_bundle_id += 1
+            flags = ofproto.ONF_BF_ATOMIC | ofproto.ONF_BF_ORDERED
+
+            open_msg = parser.ONFBundleCtrlMsg(datapath, bundle_id,
+                                               ofproto.ONF_BCT_OPEN_REQUEST, flags, [])
+            datapath.send_msg(open_msg)
+            keys = [(datapath.id, open_msg.xid)]
+
+            # Erro de um ADD vem com o xid do ADD (a mensagem interna usa o
+            # mesmo xid); erro do COMMIT, com o xid do COMMIT
+            for msg in msgs:
+                self._count(msg)
+                add_msg = parser.ONFBundleAddMsg(datapath, bundle_id, flags, msg, [])
+                datapath.send_msg(add_msg)
+                keys.append((datapath.id, add_msg.xid))
+            commit_msg = parser.ONFBundleCtrlMsg(datapath, bundle_id,
+                                                 ofproto.ONF_BCT_COMMIT_REQUEST, flags, [])
+            datapath.send_msg(commit_msg)
+            keys.append((datapath.id, commit_msg.xid))
+            self.counters["bundle"] += 1
+
+            pending = {"msgs": msgs, "batch": batch, "keys": keys, "open": keys[0]}
+            for key in keys:
+                self.open_bundles[key] = pending
+            batch["bundles"].extend(keys)
+        else:
+            for msg in msgs:
+                self._count(msg)
+                datapath.send_msg(msg)
+
+        self._send_barrier(datapath, batch)
+
+    def _send_barrier(self, datapath, batch):
+        barrier = datapath.ofproto_parser.OFPBarrierRequest(datapath)
+        self.counters["barrier"] += 1
+        datapath.send_msg(barrier)
+        key = (datapath.id, barrier.xid)
+        batch["waiting"].add(key)
+        self.pending_barriers[key] = batch
+
+    def _release_batch(self, batch, reason="barrier"):
+        """Lote confirmado por todos os switches (ou expirado): roda os callbacks."""
+        if batch["done"]:
+            return
+        batch["done"] = True
+        for key in batch["waiting"]:
+            self.pending_barriers.pop(key, None)
+        for key in batch["bundles"]:
+            self.open_bundles.pop(key, None)
+
+        self.logger.info("[BATCH] %s pronto em %.1f ms (%s)", batch["name"],
+                         (time.time() - batch["start"]) * 1000, reason)
+        for callback in batch["callbacks"]:
+            callback()
+
+    def _monitor(self):
+        """Loga periodicamente os contadores e as taxas desde o último log."""
+        while True:
+            hub.sleep(STATS_INTERVAL)
+            now = time.time()
+            elapsed = max(now - self.counters_time, 1e-9)
+            rates = ", ".join(
+                "%s=%d (%.1f/s)" % (name, total, (total - self.counters_last[name]) / elapsed)
+                for name, total in self.counters.items()
+            )
+            self.logger.info("[STATS] ECMP_MODE=%s %s", ECMP_MODE, rates)
+            if self.pi_queues:
+                self.logger.info("[STATS] filas packet-in (atual/pico): %s", " ".join(
+                    "w%d=%d/%d" % (i, q.qsize(), peak)
+                    for i, (q, peak) in enumerate(zip(self.pi_queues, self.pi_queue_peak))))
+                self.pi_queue_peak = [q.qsize() for q in self.pi_queues]
+            self.counters_last = dict(self.counters)
+            self.counters_time = now
+
+            self._age_mac_table(now)
+            if FLOW_STATS:
+                self._log_traffic(now)
+
+            if PUNT_PROTECTION:
+                self._prune_punt_state(now)
+                for dp in list(self.datapaths.values()):
+                    if self._punt_meter_enabled(dp):
+                        parser = dp.ofproto_parser
+                        dp.send_msg(parser.OFPMeterStatsRequest(dp, 0, PUNT_METER_ID))
+
+    # -----------------------------
+    # Coleta de contadores (FLOW_STATS=1)
+    # -----------------------------
+    def _poll_stats(self):
+        """Pede flow/port stats aos switches cujo intervalo adaptativo venceu."""
+        while True:
+            hub.sleep(STATS_POLL_MIN)
+            now = time.time()
+            for dpid, dp in list(self.datapaths.items()):
+                if not self.collector.due(dpid, now):
+                    continue
+                ofproto = dp.ofproto
+                parser = dp.ofproto_parser
+                dp.send_msg(parser.OFPFlowStatsRequest(dp))
+                dp.send_msg(parser.OFPPortStatsRequest(dp, 0, ofproto.OFPP_ANY))
+                self.collector.polled(dpid, now)
+
+    def _link_name(self, dpid: int, port: int) -> str:
+        for nbr, nbr_port in self.routing.adj.get(dpid, {}).items():
+            if nbr_port == port:
+                return "s%d:%d->s%d" % (dpid, port, nbr)
+        return "s%d:%d" % (dpid, port)
+
+    def _log_traffic(self, now: float):
+        """Matriz de tráfego (guardada no histórico) e enlaces mais carregados."""
+        matrix = self.collector.snapshot(now)
+        top = sorted(matrix.items(), key=lambda item: item[1], reverse=True)[:5]
+        if top:
+            self.logger.info("[TM] %s", ", ".join(
+                "%s->%s %.2f Mbps" % (src, dst, bps / 1e6) for (src, dst), bps in top))
+
+        links = sorted(((self.collector.port_rate(*key), key) for key in self.collector.port_rates),
+                       reverse=True)[:5]
+        if links:
+            self.logger.info("[LINK] %s", ", ".join(
+                "%s %.2f Mbps" % (self._link_name(*key), bps / 1e6) for bps, key in links))
+
+    def _age_mac_table(self, now: float):
+        """Expira MACs antigos (e seus fluxos do learning-switch) e hosts esquecidos do RoutingEngine."""
+        expired = self.mac_table.expire(now)
+        if expired:
+            with self.flow_batch("envelhecimento MAC"):
+                for dpid, mac, _port in expired:
+                    dp = self.datapaths.get(dpid)
+                    if dp is not None:
+                        self._del_policy(dp, POLICY_LEARNING, match=dp.ofproto_parser.OFPMatch(eth_dst=mac))
+
+        # FORWARDING=dst: hosts envelhecem pela regra de borda (flow_removed_handler),
+        # já que o tráfego deles não gera packet-in
+        if FORWARDING != "dst":
+            hosts = self.routing.hosts
+            self.routing.hosts = {mac: loc for mac, loc in hosts.items()
+                                  if self.mac_table.lookup(loc[0], mac, now) is not None}
+            # Caminhos instalados para hosts esquecidos não têm idle_timeout: remove aqui
+            gone = set(hosts) - set(self.routing.hosts)
+            if gone:
+                self._drop_paths(lambda key, _path: key[0] in gone or key[1] in gone)
+        self.logger.info("[MAC] %d entradas (expiradas=%d, expulsas=%d, movidas=%d)",
+                         len(self.mac_table), self.mac_table.expirations,
+                         self.mac_table.evictions, self.mac_table.moves)
+
+    # -----------------------------
+    # ECMP com grupo SELECT (Exp. 4, ECMP_MODE=select)
+    # -----------------------------
+    def _ecmp_select_enabled(self) -> bool:
+        return EXPERIMENT == 4 and ECMP_MODE == "select"
+
+    def _ecmp_buckets(self, datapath) -> List:
+        """Um bucket por porta UP (to_s2/to_s3), com o peso de ECMP_WEIGHTS."""
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        dpid = datapath.id
+        p = self.ports[dpid]
+
+        candidates = list(zip((p["to_s2"], p["to_s3"]), ECMP_WEIGHTS))
+        up = [(port, weight) for port, weight in candidates if self._is_port_up(dpid, port)]
+        # Ambas DOWN: mantém as duas (como _choose_ecmp_port) até alguma voltar
+        return [
+            parser.OFPBucket(
+                weight=weight,
+                watch_port=ofproto.OFPP_ANY,
+                watch_group=ofproto.OFPG_ANY,
+                actions=[parser.OFPActionOutput(port)],
+            )
+            for port, weight in (up or candidates)
+        ]
+
+    def _install_ecmp_group(self, datapath):
+        """Cria (ou atualiza) o grupo SELECT de ECMP no switch de borda."""
+        buckets = self._ecmp_buckets(datapath)
+        self.send_group(datapath, datapath.ofproto.OFPGT_SELECT, ECMP_GROUP_ID, buckets)
+
+        self.logger.info("[ECMP] dpid=%s grupo SELECT %s com %d bucket(s)",
+                         datapath.id, ECMP_GROUP_ID, len(buckets))
+
+    # -----------------------------
+    # Fast failover (Exp. 5, FAILOVER_MODE=ff)
+    # -----------------------------
+    def _ff_enabled(self) -> bool:
+        return EXPERIMENT == 5 and FAILOVER_MODE == "ff"
+
+    def _ff_groups(self, datapath) -> Dict[int, List]:
+        """Buckets dos grupos fast failover do switch: {group_id: buckets}.
+
+        Bordas (s1/s4): primário via s2, backup via s3. O primário só fica
+        no grupo enquanto o caminho por s2 está inteiro, para que, depois de
+        reconciliado, o tráfego não faça o desvio de ida e volta até s2.
+        s2: se o próximo enlace cai, devolve o pacote pela porta de entrada
+        (crankback) e a borda o reencaminha pelo backup.
+        """
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        dpid = datapath.id
+        p = self.ports.get(dpid, {})
+
+        def bucket(watch_port, out_port):
+            return parser.OFPBucket(
+                watch_port=watch_port,
+                watch_group=ofproto.OFPG_ANY,
+                actions=[parser.OFPActionOutput(out_port)],
+            )
+
+        if dpid in ECMP_EDGES:
+            group_id = FF_GROUPS[(dpid, ECMP_EDGES[dpid])]
+            buckets = [bucket(p["to_s2"], p["to_s2"])] if self._is_path_s2_up() else []
+            return {group_id: buckets + [bucket(p["to_s3"], p["to_s3"])]}
+        if dpid == 2:
+            return {
+                FF_GROUP_S2C: [bucket(p["to_s4"], p["to_s4"]),
+                               bucket(p["to_s1"], ofproto.OFPP_IN_PORT)],
+                FF_GROUP_C2S: [bucket(p["to_s1"], p["to_s1"]),
+                               bucket(p["to_s4"], ofproto.OFPP_IN_PORT)],
+            }
+        return {}
+
+    def _install_quic_ff(self, datapath):
+        """Instala grupos fast failover e regras QUIC-sim proativas no switch."""
+        parser = datapath.ofproto_parser
+        dpid = datapath.id
+        p = self.ports.get(dpid, {})
+
+        for group_id, buckets in self._ff_groups(datapath).items():
+            self.send_group(datapath, datapath.ofproto.OFPGT_FF, group_id, buckets)
+        self._install_quic_rules(datapath)
+
+        # Crankback na borda: pacote devolvido por s2 segue pelo backup via s3
+        if dpid in ECMP_EDGES:
+            src_mac = ECMP_EDGES[dpid]
+            dst_mac = H2_MAC if src_mac == H1_MAC else H1_MAC
+            match = self._quic_direction_match(parser, src_mac, dst_mac, in_port=p["to_s2"])
+            self.add_flow(datapath, 210, match, [parser.OFPActionOutput(p["to_s3"])],
+                          cookie=self._cookie(POLICY_QUIC))
+
+    def _reconcile_ff(self):
+        """Depois que o switch já desviou, ajusta os grupos das bordas ao estado das portas."""
+        self.logger.info("[FF] reconciliando grupos (caminho via s2 UP=%s)", self._is_path_s2_up())
+        with self.flow_batch("reconciliação FF"):
+            for dpid in ECMP_EDGES:
+                datapath = self.datapaths.get(dpid)
+                if datapath is None:
+                    continue
+                for group_id, buckets in self._ff_groups(datapath).items():
+                    self.send_group(datapath, datapath.ofproto.OFPGT_FF, group_id, buckets)
+
+    # -----------------------------
+    # Engenharia de tráfego (Exp. 4, ECMP_MODE=te)
+    # -----------------------------
+    def _te_enabled(self) -> bool:
+        return EXPERIMENT == 4 and ECMP_MODE == "te"
+
+    def _te_port_load(self, dpid: int, port: int) -> float:
+        """Carga da porta em bps: medida + descartes (penalidade) + fluxos novos ainda não medidos."""
+        return (self.collector.port_rate(dpid, port)
+                + self.collector.port_drop_rate(dpid, port) * TE_DROP_PENALTY_BITS
+                + self.te_pending.get((dpid, port), 0.0))
+
+    def _te_candidates(self, dpid: int, dst_mac: str) -> Dict[int, Path]:
+        """
+        Porta de saída UP -> caminho [(dpid, porta), ...] até o switch de
+        dst_mac, tirados dos TE_K_PATHS menores caminhos (o mais curto por porta).
+        """
+        loc = self.routing.hosts.get(dst_mac)
+        dst_dpid = loc[0] if loc else next((d for d, mac in ECMP_EDGES.items() if mac == dst_mac), None)
+        candidates: Dict[int, Path] = {}
+        if dst_dpid is None:
+            return candidates
+        for dpids in self.routing.k_shortest_paths(dpid, dst_dpid, TE_K_PATHS):
+            hops = self.routing.path_ports(dpids)
+            if hops and self._is_port_up(dpid, hops[0][1]):
+                candidates.setdefault(hops[0][1], hops)
+        return candidates
+
+    def _te_path_load(self, hops: Path) -> float:
+        """Carga de um caminho: o enlace mais carregado."""
+        return max(self._te_port_load(hop_dpid, hop_port) for hop_dpid, hop_port in hops)
+
+    def _te_choose_port(self, dpid: int, dst_mac: str) -> int:
+        """Porta cujo caminho candidato até dst_mac está menos carregado (sem candidato: via s3)."""
+        candidates = self._te_candidates(dpid, dst_mac)
+        if not candidates:
+            return self.ports[dpid]["to_s3"]
+        return min(candidates, key=lambda port: self._te_path_load(candidates[port]))
+
+    def _quic_flow_match(self, parser, src: str, dst: str, client_port: int):
+        """Match de um fluxo QUIC-sim individual (identificado pela porta UDP do cliente)."""
+        if src == H2_MAC:
+            udp_ports = {"udp_src": client_port, "udp_dst": QUIC_UDP_PORT}
+        else:
+            udp_ports = {"udp_src": QUIC_UDP_PORT, "udp_dst": client_port}
+        return parser.OFPMatch(eth_type=0x0800, ip_proto=17, eth_src=src, eth_dst=dst, **udp_ports)
+
+    def _te_install_flow(self, datapath, src: str, dst: str, client_port: int) -> List:
+        """
+        Fluxo novo saindo da borda: aloca o caminho menos carregado e instala
+        uma regra só para ele. Retorna as ações (para o packet-out).
+        """
+        parser = datapath.ofproto_parser
+        dpid = datapath.id
+        index_key = (dpid, src, dst, client_port)
+        cookie = self.te_index.get(index_key)
+        if cookie is not None and cookie in self.te_flows:
+            # Pacotes do mesmo fluxo antes da regra chegar ao switch
+            return [parser.OFPActionOutput(self.te_flows[cookie]["port"])]
+
+        out_port = self._te_choose_port(dpid, dst)
+        cookie = self._cookie(POLICY_QUIC) | self.next_flow_id
+        self.next_flow_id = self.next_flow_id % 0xFFFFFFFF + 1
+
+        match = self._quic_flow_match(parser, src, dst, client_port)
+        actions = [parser.OFPActionOutput(out_port)]
+        self.add_flow(datapath, TE_PRIORITY, match, actions, cookie=cookie, idle_timeout=TE_IDLE_TIMEOUT)
+
+        self.te_flows[cookie] = {"dpid": dpid, "port": out_port, "match": match, "index": index_key,
+                                 "moved": 0.0, "created": time.time()}
+        self.te_index[index_key] = cookie
+        self.te_pending[(dpid, out_port)] = self.te_pending.get((dpid, out_port), 0.0) + TE_NEW_FLOW_BPS
+        self.logger.info("[TE] dpid=%s fluxo %s->%s udp=%s -> porta %s", dpid, src, dst, client_port, out_port)
+        return actions
+
+    def _te_rebalance(self, dpid: int, now: float):
+        """
+        Com port stats novos da borda: se o caminho mais carregado está
+        TE_IMBALANCE acima do menos carregado, move um elefante (o que mais
+        aproxima as cargas) reescrevendo a regra dele. No máximo um fluxo por
+        rodada.
+        """
+        datapath = self.datapaths.get(dpid)
+        src_mac = ECMP_EDGES.get(dpid)
+        if datapath is None or src_mac is None:
+            return
+        self._te_forget_idle(dpid, now)
+
+        dst_mac = H2_MAC if src_mac == H1_MAC else H1_MAC
+        candidates = self._te_candidates(dpid, dst_mac)
+        if len(candidates) < 2:
+            return
+        loads = {port: self._te_path_load(hops) for port, hops in candidates.items()}
+        hi = max(loads, key=loads.get)
+        lo = min(loads, key=loads.get)
+        gap = loads[hi] - loads[lo]
+        if loads[hi] < TE_ELEPHANT_BPS or gap < TE_IMBALANCE * loads[hi]:
+            return
+
+        # Mover um fluxo de taxa r reduz o pico se r < gap; o ideal é r = gap/2
+        movable = []
+        for cookie, flow in self.te_flows.items():
+            rate = self.collector.flow_rate(dpid, cookie)
+            if (flow["dpid"] == dpid and flow["port"] == hi and TE_ELEPHANT_BPS <= rate < gap
+                    and now - flow["moved"] >= TE_HOLD):
+                movable.append((abs(rate - gap / 2), cookie, rate))
+        if not movable:
+            return
+
+        _, cookie, rate = min(movable)
+        flow = self.te_flows[cookie]
+        parser = datapath.ofproto_parser
+        self.add_flow(datapath, TE_PRIORITY, flow["match"], [parser.OFPActionOutput(lo)],
+                      cookie=cookie, idle_timeout=TE_IDLE_TIMEOUT)
+        flow["port"] = lo
+        flow["moved"] = now
+        self.logger.info("[TE] dpid=%s rebalanceando: fluxo %.2f Mbps da porta %s (%.2f Mbps) "
+                         "para %s (%.2f Mbps)", dpid, rate / 1e6, hi, loads[hi] / 1e6, lo, loads[lo] / 1e6)
+
+    def _te_forget_idle(self, dpid: int, now: float):
+        """Esquece fluxos cuja regra expirou (idle_timeout) e sumiu dos flow stats."""
+        grace = 2 * STATS_POLL_MAX + TE_IDLE_TIMEOUT
+        for cookie, flow in list(self.te_flows.items()):
+            if (flow["dpid"] == dpid and now - flow["created"] > grace
+                    and (dpid, cookie) not in self.collector.flow_rates):
+                del self.te_flows[cookie]
+                self.te_index.pop(flow["index"], None)
+
+    def _quic_actions(self, parser, dpid: int, src_mac: str, in_port: int):
+        """Ações para um pacote QUIC-sim; grupos ECMP/fast failover quando habilitados."""
+        if self._ecmp_select_enabled() and ECMP_EDGES.get(dpid) == src_mac:
+            return [parser.OFPActionGroup(ECMP_GROUP_ID)]
+        if self._ff_enabled() and (dpid, src_mac) in FF_GROUPS:
+            return [parser.OFPActionGroup(FF_GROUPS[(dpid, src_mac)])]
+
+        out_port = self._route_quic_out_port(dpid, src_mac=src_mac, in_port=in_port)
+        if out_port is None:
+            return None
+        return [parser.OFPActionOutput(out_port)]
+
+    def _install_quic_rules(self, datapath, priority=200):
+        """Instala proativamente as regras QUIC-sim dos dois sentidos."""
+        parser = datapath.ofproto_parser
+        dpid = datapath.id
+        p = self.ports.get(dpid, {})
+
+        # (origem, destino, porta de entrada nos intermediários)
+        directions = [
+            (H1_MAC, H2_MAC, p.get("to_s1")),
+            (H2_MAC, H1_MAC, p.get("to_s4")),
+        ]
+        for src_mac, dst_mac, in_port in directions:
+            actions = self._quic_actions(parser, dpid, src_mac, in_port)
+            if actions is not None:
+                match = self._quic_direction_match(parser, src_mac, dst_mac)
+                self.add_flow(datapath, priority, match, actions, cookie=self._cookie(POLICY_QUIC))
+
+    def _reprogram_quic_exp5(self):
+        """
+        No Exp. 5 (modo reactive), reprograma regras QUIC quando o link s1-s2
+        muda. Make-before-break: a nova geração substitui as regras (mesmo
+        match e prioridade) em todos os switches e só depois dos barriers a
+        geração antiga é apagada, por cookie. Não há janela sem regra.
+        """
+        link_up = self._is_link_s1_s2_up()
+        old = self._next_generation(POLICY_QUIC)
+        self.logger.info("[SDN] Exp.5: reprogramando QUIC (link s1-s2 UP=%s, geração %d -> %d)",
+                         link_up, old, self.generations[POLICY_QUIC])
+
+        def retire_old():
+            with self.flow_batch("remoção QUIC geração %d" % old):
+                for dp in list(self.datapaths.values()):
+                    self._del_policy(dp, POLICY_QUIC, generation=old)
+
+        # Instala regras atuais (proativas) para os dois sentidos
+        with self.flow_batch("reprogramação Exp.5", on_done=retire_old):
+            for dp in list(self.datapaths.values()):
+                self._install_quic_rules(dp, priority=300)
+
+    # -----------------------------
+    # Roteamento por menor caminho (ROUTING=shortest)
+    # -----------------------------
+    def _seed_static_topology(self):
+        """Monta o grafo do RoutingEngine a partir de DEFAULT_PORTS (to_sN = enlace)."""
+        for dpid, ports in self.ports.items():
+            for name, port_no in ports.items():
+                if name.startswith("to_s"):
+                    self.routing.add_link(dpid, port_no, int(name[len("to_s"):]))
+                else:
+                    self.routing.add_port(dpid, port_no)
+
+    def _restore_static_link(self, dpid: int, port_no: int):
+        """Porta to_sN voltou: recoloca o enlace de DEFAULT_PORTS (se a outra ponta também está UP)."""
+        for name, port in self.ports.get(dpid, {}).items():
+            if not name.startswith("to_s") or port != port_no:
+                continue
+            nbr = int(name[len("to_s"):])
+            back = self.ports.get(nbr, {}).get("to_s%d" % dpid)
+            if back is None or not self._is_port_up(nbr, back):
+                return
+            changed = self.routing.add_link(dpid, port_no, nbr)
+            changed = self.routing.add_link(nbr, back, dpid) or changed
+            if changed:
+                self.logger.info("[TOPO] enlace s%s-s%s de volta", dpid, nbr)
+                with self.flow_batch("porta de enlace UP"):
+                    self._refresh_dst_rules()
+                    self._update_flood_tree()
+            return
+
+    def _route_shortest(self, msg, datapath, in_port: int, src: str, dst: str) -> bool:
+        """Encaminha pelo RoutingEngine. Retorna False se não há topologia descoberta."""
+        if not any(self.routing.adj.values()):
+            return False
+
+        if self._route_path(msg, datapath, in_port, src, dst):
+            return True
+
+        # Destino desconhecido (ou broadcast): só portas de borda
+        self._flood_edges(msg, datapath.id, in_port)
+        return True
+
+    def _route_path(self, msg, datapath, in_port: int, src: str, dst: str) -> bool:
+        """
+        Se o destino tem caminho conhecido, instala o caminho inteiro num só
+        packet-in e solta o pacote no ingresso depois dos barriers.
+        Retorna False se o caminho ainda não é conhecido.
+        """
+        path = self.routing.host_path(datapath.id, dst, flow_key=src + dst)
+        if path is None:
+            return False
+
+        parser = datapath.ofproto_parser
+        actions = [parser.OFPActionOutput(path[0][1])]
+        self._install_path(
+            src, dst, path,
+            on_ready=lambda: self._packet_out(datapath, msg, in_port, actions),
+        )
+        return True
+
+    def _install_path(self, src: str, dst: str, path: List[Tuple[int, int]], on_ready=None):
+        """
+        Instala o caminho inteiro para o par src -> dst em um lote: flow-mods do
+        egresso para o ingresso (um pacote liberado cedo nunca encontra um
+        switch adiante sem regra) e um barrier por switch. on_ready roda
+        quando todos os barriers voltam.
+        """
+        egress_first = [hop_dpid for hop_dpid, _ in reversed(path)]
+        with self.flow_batch("%s -> %s" % (src, dst), on_done=on_ready, order=egress_first):
+            for hop_dpid, out_port in reversed(path):
+                dp = self.datapaths.get(hop_dpid)
+                if dp is None:
+                    continue
+                parser = dp.ofproto_parser
+                match = self._route_match(parser, src, dst)
+                self.add_flow(dp, ROUTE_PRIORITY, match, [parser.OFPActionOutput(out_port)],
+                              cookie=self._cookie(POLICY_ROUTE))
+
+        self.installed_paths[(src, dst)] = path
+        self.logger.info("[ROUTE] %s -> %s via %s", src, dst,
+                         " ".join("%s:%s" % hop for hop in path))
+
+    def _drop_paths(self, stale):
+        """Remove dos switches os caminhos instalados para os quais stale(key, path) é True."""
+        with self.flow_batch("remoção de caminhos"):
+            for key, path in list(self.installed_paths.items()):
+                if not stale(key, path):
+                    continue
+                src, dst = key
+                for hop_dpid, _ in path:
+                    dp = self.datapaths.get(hop_dpid)
+                    if dp is not None:
+                        match = self._route_match(dp.ofproto_parser, src, dst)
+                        self._del_policy(dp, POLICY_ROUTE, match=match)
+                del self.installed_paths[key]
+
+    def _flood_edges(self, msg, dpid: int, in_port: int):
+        """Entrega o pacote em todas as portas de borda da rede, exceto a de entrada."""
+        for hop_dpid, dp in self.datapaths.items():
+            ofproto = dp.ofproto
+            parser = dp.ofproto_parser
+            actions = [
+                parser.OFPActionOutput(port)
+                for port in self.routing.edge_ports(hop_dpid)
+                if (hop_dpid, port) != (dpid, in_port)
+            ]
+            if not actions:
+                continue
+            out = parser.OFPPacketOut(
+                datapath=dp,
+                buffer_id=ofproto.OFP_NO_BUFFER,
+                in_port=ofproto.OFPP_CONTROLLER,
+                actions=actions,
+                data=msg.data,
             )
+            dp.send_msg(out)
+
+    # -----------------------------
+    # Encaminhamento por destino (FORWARDING=dst)
+    # -----------------------------
+    def _dst_out_port(self, dpid: int, mac: str) -> Optional[int]:
+        """Porta de saída de dpid rumo ao host mac (menor caminho); None se desconhecido/inalcançável."""
+        path = self.routing.host_path(dpid, mac, flow_key=mac)
+        return path[0][1] if path else None
+
+    def _install_dst_rules(self, macs):
+        """
+        (Re)instala em todos os switches a regra eth_dst de cada host; onde não
+        há caminho, remove. A do switch de borda do host expira por
+        inatividade e avisa o controlador (flow_removed_handler).
+        """
+        with self.flow_batch("regras por destino"):
+            for mac in macs:
+                loc = self.routing.hosts.get(mac)
+                for dpid, dp in list(self.datapaths.items()):
+                    parser = dp.ofproto_parser
+                    match = parser.OFPMatch(eth_dst=mac)
+                    out_port = self._dst_out_port(dpid, mac)
+                    if out_port is None:
+                        self._del_policy(dp, POLICY_DST, match=match)
+                        continue
+                    edge = loc is not None and loc[0] == dpid
+                    self.add_flow(dp, DST_PRIORITY, match, [parser.OFPActionOutput(out_port)],
+                                  cookie=self._cookie(POLICY_DST),
+                                  idle_timeout=DST_IDLE_TIMEOUT if edge else 0,
+                                  flags=dp.ofproto.OFPFF_SEND_FLOW_REM if edge else 0)
+
+    def _forget_dst_host(self, mac: str):
+        """Host esquecido: tira a localização e as regras por destino dele de todos os switches."""
+        self.routing.hosts.pop(mac, None)
+        with self.flow_batch("envelhecimento por destino"):
+            for dp in list(self.datapaths.values()):
+                self._del_policy(dp, POLICY_DST, match=dp.ofproto_parser.OFPMatch(eth_dst=mac))
 
-        datapath.send_msg(mod)
+    def _refresh_dst_rules(self):
+        """Topologia mudou: refaz as regras por destino de todos os hosts conhecidos."""
+        if FORWARDING == "dst" and self.routing.hosts:
+            self._install_dst_rules(list(self.routing.hosts))
+
+    # -----------------------------
+    # Broadcast pela árvore geradora (FLOOD_TREE)
+    # -----------------------------
+    def _update_flood_tree(self):
+        """
+        Recalcula a árvore e reprograma grupo + regras de broadcast só nos
+        switches cujo conjunto de portas de flood mudou.
+        """
+        if not FLOOD_TREE or not any(self.routing.adj.values()):
+            return
+        with self.flow_batch("árvore de flood"):
+            for dpid, dp in list(self.datapaths.items()):
+                ports = tuple(self.routing.flood_ports(dpid))
+                if self.flood_sets.get(dpid) == ports:
+                    continue
+                self._install_flood(dp, ports)
+                self.logger.info("[FLOOD] dpid=%s portas de flood=%s", dpid, list(ports))
+
+    def _install_flood(self, datapath, ports):
+        """Grupo ALL com as portas de flood; broadcast das bordas também vai ao controlador."""
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        dpid = datapath.id
+
+        # Saída para a própria porta de entrada é descartada pelo switch:
+        # o bucket da porta de origem não devolve o pacote
+        buckets = [parser.OFPBucket(actions=[parser.OFPActionOutput(port)]) for port in ports]
+        self.send_group(datapath, ofproto.OFPGT_ALL, FLOOD_GROUP_ID, buckets)
+
+        cookie = self._cookie(POLICY_FLOOD)
+        self._del_policy(datapath, POLICY_FLOOD)
+        # Bit de grupo do MAC de destino: broadcast e multicast
+        multicast = ("01:00:00:00:00:00", "01:00:00:00:00:00")
+        flood = parser.OFPActionGroup(FLOOD_GROUP_ID)
+        self.add_flow(datapath, FLOOD_PRIORITY, parser.OFPMatch(eth_dst=multicast),
+                      [flood], cookie=cookie)
+        # A cópia ao controlador passa pelo meter de punt, como a table-miss
+        to_controller = parser.OFPActionOutput(ofproto.OFPP_CONTROLLER, ofproto.OFPCML_NO_BUFFER)
+        meter_id = PUNT_METER_ID if self._punt_meter_enabled(datapath) else None
+        for port in self.routing.edge_ports(dpid):
+            match = parser.OFPMatch(in_port=port, eth_dst=multicast)
+            self.add_flow(datapath, FLOOD_PRIORITY + 1, match, [flood, to_controller], cookie=cookie,
+                          meter_id=meter_id)
+        self.flood_sets[dpid] = tuple(ports)
+
+    def _flood_tree(self, msg, datapath, in_port: int):
+        """Flood só pelas portas da árvore geradora + bordas (sem OFPP_FLOOD no anel)."""
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        if not any(self.routing.adj.values()):
+            ports = [ofproto.OFPP_FLOOD]
+        else:
+            ports = [port for port in self.routing.flood_ports(datapath.id) if port != in_port]
+        if ports:
+            self._packet_out(datapath, msg, in_port, [parser.OFPActionOutput(port) for port in ports])
+
+    def _packet_out(self, datapath, msg, in_port, actions):
+        """Packet-out do pacote do packet-in (usa o buffer do switch, se houver)."""
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+
+        data = msg.data if msg.buffer_id == ofproto.OFP_NO_BUFFER else None
+        out = parser.OFPPacketOut(
+            datapath=datapath,
+            buffer_id=msg.buffer_id,
+            in_port=in_port,
+            actions=actions,
+            data=data
+        )
+        datapath.send_msg(out)
 
     def _is_port_up(self, dpid: int, port_no: int) -> bool:
         return self.port_state.get((dpid, port_no), True)
 
+    def _is_link_s1_s2_up(self) -> bool:
+        """Link s1<->s2 (superior) está UP? Checa os dois lados quando possível."""
+        return (self._is_port_up(1, self.ports[1]["to_s2"])
+                and self._is_port_up(2, self.ports[2]["to_s1"]))
+
+    def _is_path_s2_up(self) -> bool:
+        """Caminho superior inteiro (s1-s2 e s2-s4) está UP?"""
+        return (self._is_link_s1_s2_up()
+                and self._is_port_up(2, self.ports[2]["to_s4"])
+                and self._is_port_up(4, self.ports[4]["to_s2"]))
+
     def _choose_ecmp_port(self, dpid: int, candidates: Tuple[int, int]) -> int:
         """Escolhe aleatoriamente uma porta UP entre duas opções.
         Se uma estiver DOWN, força a outra.
@@ -131,6 +1388,10 @@ class SimpleSwitch13(app_manager.RyuApp):
         p2_up = self._is_port_up(dpid, p2)
 
         if p1_up and p2_up:
+            if self._te_enabled():
+                dst_mac = H2_MAC if ECMP_EDGES.get(dpid) == H1_MAC else H1_MAC
+                port = self._te_choose_port(dpid, dst_mac)
+                return port if port in candidates else random.choice([p1, p2])
             return random.choice([p1, p2])
         if p1_up:
             return p1
@@ -158,8 +1419,8 @@ class SimpleSwitch13(app_manager.RyuApp):
                 if EXPERIMENT == 4:
                     return self._choose_ecmp_port(dpid, (p["to_s2"], p["to_s3"]))
                 if EXPERIMENT == 5:
-                    # Preferir caminho superior via s2, mas se a porta para s2 cair, desvia para s3.
-                    if self._is_port_up(dpid, p["to_s2"]):
+                    # Preferir caminho superior via s2, mas se o link s1-s2 cair, desvia para s3.
+                    if self._is_link_s1_s2_up():
                         return p["to_s2"]
                     return p["to_s3"]
                 # fallback: caminho superior
@@ -175,7 +1436,8 @@ class SimpleSwitch13(app_manager.RyuApp):
                 if EXPERIMENT == 4:
                     return self._choose_ecmp_port(dpid, (p["to_s2"], p["to_s3"]))
                 if EXPERIMENT == 5:
-                    if self._is_port_up(dpid, p["to_s2"]):
+                    # Mesmo com s4-s2 UP, se s1-s2 caiu, não há como chegar em s1 por s2.
+                    if self._is_link_s1_s2_up():
                         return p["to_s2"]
                     return p["to_s3"]
                 return p["to_s2"]
@@ -199,14 +1461,67 @@ class SimpleSwitch13(app_manager.RyuApp):
 
         return None
 
-    def _is_quic_packet(self, pkt: packet.Packet) -> bool:
+    def _quic_direction_match(self, parser, eth_src: str, eth_dst: str, in_port: Optional[int] = None):
+        """Match direcional do QUIC-sim: cliente->servidor casa udp_dst, o inverso udp_src.
+
+        Evita que a regra de um sentido capture os pacotes do outro.
+        Com in_port, casa só os pacotes que chegam por aquela porta.
+        Com PIPELINE=multi, a tabela de classificação já marcou o QUIC-sim no
+        metadata: basta metadata + destino.
+        """
+        fields = {}
+        if in_port is not None:
+            fields["in_port"] = in_port
+
+        if PIPELINE == "multi":
+            if (eth_src, eth_dst) not in ((H1_MAC, H2_MAC), (H2_MAC, H1_MAC)):
+                return None
+            return parser.OFPMatch(metadata=(META_QUIC, META_QUIC), eth_dst=eth_dst, **fields)
+
+        if eth_src == H2_MAC and eth_dst == H1_MAC:
+            return parser.OFPMatch(
+                eth_type=0x0800,
+                ip_proto=17,
+                eth_src=H2_MAC,
+                eth_dst=H1_MAC,
+                udp_dst=QUIC_UDP_PORT,
+                **fields,
+            )
+        if eth_src == H1_MAC and eth_dst == H2_MAC:
+            return parser.OFPMatch(
+                eth_type=0x0800,
+                ip_proto=17,
+                eth_src=H1_MAC,
+                eth_dst=H2_MAC,
+                udp_src=QUIC_UDP_PORT,
+                **fields,
+            )
+        return None
+
+    def _classify(self, data) -> Optional[PacketFields]:
+        """Campos do packet-in: leitura direta dos bytes; parser do Ryu só para quadros incomuns."""
+        fields = classify(data)
+        if fields is not None:
+            return fields
+
+        self.counters["slow_parse"] += 1
+        pkt = packet.Packet(data)
+        eth = pkt.get_protocol(ethernet.ethernet)
+        if eth is None:
+            return None
         ip = pkt.get_protocol(ipv4.ipv4)
-        if ip is None or ip.proto != 17:
-            return False
         u = pkt.get_protocol(udp.udp)
-        if u is None:
+        return PacketFields(
+            eth.dst, eth.src, eth.ethertype,
+            ip.proto if ip is not None else None,
+            u.src_port if u is not None else None,
+            u.dst_port if u is not None else None,
+        )
+
+    def _is_quic_packet(self, fields: PacketFields) -> bool:
+        if fields.ip_proto != IP_PROTO_UDP:
             return False
-        return (u.dst_port == QUIC_UDP_PORT) or (u.src_port == QUIC_UDP_PORT)
+        return (fields.dst_port == QUIC_UDP_PORT) or (fields.src_port == QUIC_UDP_PORT)
 
     # -----------------------------
     # Eventos OpenFlow
@@ -220,12 +1535,36 @@ class SimpleSwitch13(app_manager.RyuApp):
         ofproto = datapath.ofproto
         parser = datapath.ofproto_parser
 
-        match = parser.OFPMatch()
-        actions = [parser.OFPActionOutput(ofproto.OFPP_CONTROLLER,
-                                          ofproto.OFPCML_NO_BUFFER)]
-        self.add_flow(datapath, 0, match, actions)
+        # registra datapath
+        self.datapaths[datapath.id] = datapath
+
+        # Meter antes da bundle de configuração (a table-miss usa o meter)
+        self._install_punt_meter(datapath)
 
-        self.logger.info("Table-miss instalada para switch %s", datapath.id)
+        with self.flow_batch("configuração dpid=%s" % datapath.id):
+            if PIPELINE == "multi":
+                self._install_pipeline(datapath)
+            self._install_table_miss(datapath)
+
+            self.logger.info("Table-miss instalada para switch %s", datapath.id)
+
+            # Exp. 4 com grupo SELECT / Exp. 5 com fast failover: grupos e regras
+            # QUIC proativas, sem packet-in por pacote
+            if self._ecmp_select_enabled() or self._ff_enabled() or FLOOD_TREE:
+                self._reset_groups(datapath)
+            if self._ecmp_select_enabled():
+                if datapath.id in ECMP_EDGES:
+                    self._install_ecmp_group(datapath)
+                self._install_quic_rules(datapath)
+            elif self._ff_enabled():
+                self._install_quic_ff(datapath)
+            elif EXPERIMENT == 5:
+                self._reprogram_quic_exp5()
+
+            # Switch (re)conectado recebe as regras por destino já conhecidas
+            # e o grupo de flood da árvore atual
+            self._refresh_dst_rules()
+            self._update_flood_tree()
 
     @set_ev_cls(ofp_event.EventOFPPortStatus, MAIN_DISPATCHER)
     def port_status_handler(self, ev):
@@ -252,8 +1591,251 @@ class SimpleSwitch13(app_manager.RyuApp):
         else:
             self.logger.info("[PORT] dpid=%s port=%s => UP", dpid, port_no)
 
+        # Porta de enlace caiu: tira os dois sentidos do grafo já (o LLDP só
+        # percebe depois do timeout) e a árvore de flood é refeita.
+        # Na volta, o enlace reaparece pelo LLDP (link_add_handler) ou, sem
+        # LLDP (ROUTING=static), volta de DEFAULT_PORTS.
+        if link_down:
+            with self.flow_batch("porta de enlace DOWN"):
+                for nbr, port in list(self.routing.adj.get(dpid, {}).items()):
+                    if port == port_no:
+                        back = self.routing.adj.get(nbr, {}).get(dpid)
+                        self._remove_link(dpid, port_no, nbr)
+                        if back is not None:
+                            self._remove_link(nbr, back, dpid)
+        elif ROUTING == "static":
+            self._restore_static_link(dpid, port_no)
+
+        # Grupo SELECT acompanha as portas UP da borda
+        if self._ecmp_select_enabled() and (dpid, ECMP_GROUP_ID) in self.groups:
+            p = self.ports[dpid]
+            if port_no in (p["to_s2"], p["to_s3"]):
+                self._install_ecmp_group(datapath)
+
+        if EXPERIMENT == 5:
+            if self._ff_enabled():
+                # O switch já desviou pelo bucket de backup; só reconcilia
+                path_ports = {
+                    (1, self.ports[1]["to_s2"]), (2, self.ports[2]["to_s1"]),
+                    (2, self.ports[2]["to_s4"]), (4, self.ports[4]["to_s2"]),
+                }
+                if (dpid, port_no) in path_ports:
+                    self._reconcile_ff()
+            else:
+                # Se o link s1-s2 (em qualquer lado) mudar, reprograma regras QUIC
+                s1_to_s2 = self.ports[1]["to_s2"]
+                s2_to_s1 = self.ports[2]["to_s1"]
+                if (dpid == 1 and port_no == s1_to_s2) or (dpid == 2 and port_no == s2_to_s1):
+                    self._reprogram_quic_exp5()
+
+    # -----------------------------
+    # Eventos de topologia (ryu.topology, precisa de --observe-links)
+    # -----------------------------
+    @set_ev_cls(topo_event.EventSwitchEnter)
+    def switch_enter_handler(self, ev):
+        switch = ev.switch
+        ports = [p.port_no for p in switch.ports if not p.is_reserved()]
+        self.routing.add_switch(switch.dp.id, ports)
+
+    @set_ev_cls(topo_event.EventSwitchLeave)
+    def switch_leave_handler(self, ev):
+        dpid = ev.switch.dp.id
+        self._drop_paths(lambda key, path: any(hop == dpid for hop, _ in path))
+        self.routing.remove_switch(dpid)
+        self.mac_table.forget_switch(dpid)
+        self.collector.forget_switch(dpid)
+        self.datapaths.pop(dpid, None)
+        self.flood_sets.pop(dpid, None)
+        self._refresh_dst_rules()
+        self._update_flood_tree()
+
+    @set_ev_cls(topo_event.EventPortAdd)
+    def port_add_handler(self, ev):
+        port = ev.port
+        if not port.is_reserved():
+            self.routing.add_port(port.dpid, port.port_no)
+            self._update_flood_tree()
+
+    @set_ev_cls(topo_event.EventLinkAdd)
+    def link_add_handler(self, ev):
+        src, dst = ev.link.src, ev.link.dst
+        if self.routing.add_link(src.dpid, src.port_no, dst.dpid):
+            self.logger.info("[TOPO] enlace %s:%s -> %s:%s", src.dpid, src.port_no,
+                             dst.dpid, dst.port_no)
+            self._refresh_dst_rules()
+            self._update_flood_tree()
+
+    @set_ev_cls(topo_event.EventLinkDelete)
+    def link_delete_handler(self, ev):
+        src, dst = ev.link.src, ev.link.dst
+        if self._remove_link(src.dpid, src.port_no, dst.dpid):
+            self.logger.info("[TOPO] enlace removido %s:%s -> %s:%s", src.dpid, src.port_no,
+                             dst.dpid, dst.port_no)
+
+    def _remove_link(self, src_dpid: int, src_port: int, dst_dpid: int) -> bool:
+        """Tira o enlace dirigido do grafo e refaz o que dependia dele. True se existia."""
+        if not self.routing.remove_link(src_dpid, dst_dpid):
+            return False
+        # Caminhos instalados que usavam o enlace são refeitos no próximo packet-in
+        hop = (src_dpid, src_port)
+        self._drop_paths(lambda key, path: hop in path)
+        self._refresh_dst_rules()
+        self._update_flood_tree()
+        return True
+
+    @set_ev_cls(ofp_event.EventOFPFlowRemoved, MAIN_DISPATCHER)
+    def flow_removed_handler(self, ev):
+        """Regra por destino no switch de borda do host expirou por inatividade: esquece o host."""
+        msg = ev.msg
+        datapath = msg.datapath
+        if (msg.cookie >> COOKIE_POLICY_SHIFT != POLICY_DST
+                or msg.reason != datapath.ofproto.OFPRR_IDLE_TIMEOUT):
+            return
+        mac = msg.match.get("eth_dst")
+        loc = self.routing.hosts.get(mac)
+        if loc is None or loc[0] != datapath.id:
+            return
+        self.logger.info("[DST] host %s sem tráfego há %ds; regras por destino removidas",
+                         mac, DST_IDLE_TIMEOUT)
+        self._forget_dst_host(mac)
+
+    @set_ev_cls(ofp_event.EventONFBundleCtrlMsg, [CONFIG_DISPATCHER, MAIN_DISPATCHER])
+    def bundle_ctrl_handler(self, ev):
+        """COMMIT confirmado: a bundle foi aplicada, esquece os xids dela."""
+        msg = ev.msg
+        if msg.type != msg.datapath.ofproto.ONF_BCT_COMMIT_REPLY:
+            return
+        pending = self.open_bundles.get((msg.datapath.id, msg.xid))
+        if pending is not None:
+            for key in pending["keys"]:
+                self.open_bundles.pop(key, None)
+
+    @set_ev_cls(ofp_event.EventOFPBarrierReply, [CONFIG_DISPATCHER, MAIN_DISPATCHER])
+    def barrier_reply_handler(self, ev):
+        """Confirma um barrier de lote; o último do lote roda os callbacks."""
+        key = (ev.msg.datapath.id, ev.msg.xid)
+        batch = self.pending_barriers.pop(key, None)
+        if batch is None:
+            return
+        batch["waiting"].discard(key)
+        if not batch["waiting"]:
+            self._release_batch(batch)
+
+    @set_ev_cls(ofp_event.EventOFPFlowStatsReply, MAIN_DISPATCHER)
+    def flow_stats_reply_handler(self, ev):
+        msg = ev.msg
+        samples = []
+        for stat in msg.body:
+            src, dst = stat.match.get("eth_src"), stat.match.get("eth_dst")
+            # Regras de fluxo individual (id nos 32 bits baixos do cookie): chave = cookie
+            key = stat.cookie if stat.cookie & 0xFFFFFFFF else (stat.table_id, stat.priority, str(stat.match))
+            samples.append((
+                key,
+                (src, dst) if src and dst else None,
+                stat.byte_count,
+                stat.duration_sec + stat.duration_nsec / 1e9,
+            ))
+        complete = not (msg.flags & msg.datapath.ofproto.OFPMPF_REPLY_MORE)
+        self.collector.update_flows(msg.datapath.id, samples, time.time(), complete)
+
+    @set_ev_cls(ofp_event.EventOFPPortStatsReply, MAIN_DISPATCHER)
+    def port_stats_reply_handler(self, ev):
+        msg = ev.msg
+        ofproto = msg.datapath.ofproto
+        samples = [(stat.port_no, stat.tx_bytes, stat.rx_bytes, stat.tx_dropped)
+                   for stat in msg.body if stat.port_no <= ofproto.OFPP_MAX]
+        dpid = msg.datapath.id
+        now = time.time()
+        self.collector.update_ports(dpid, samples, now)
+
+        if self._te_enabled():
+            # Carga medida já inclui os fluxos novos
+            for port, *_ in samples:
+                self.te_pending.pop((dpid, port), None)
+            self._te_rebalance(dpid, now)
+
+    @set_ev_cls(ofp_event.EventOFPMeterStatsReply, MAIN_DISPATCHER)
+    def meter_stats_reply_handler(self, ev):
+        """Loga quantos packet-ins o meter de punt deixou passar e quantos descartou."""
+        dpid = ev.msg.datapath.id
+        for stat in ev.msg.body:
+            if stat.meter_id != PUNT_METER_ID:
+                continue
+            dropped = sum(band.packet_band_count for band in stat.band_stats)
+            self.logger.info("[PUNT] dpid=%s meter: packet-ins=%d, descartados no switch=%d",
+                             dpid, stat.packet_in_count - dropped, dropped)
+
+    @set_ev_cls(ofp_event.EventOFPErrorMsg, [CONFIG_DISPATCHER, MAIN_DISPATCHER])
+    def error_msg_handler(self, ev):
+        """
+        Bundle recusada (OPEN, ADD ou COMMIT): reenvia a fila sem bundle; se
+        foi o OPEN, o switch não tem bundles e não tenta mais.
+        Switch sem suporte a meters: table-miss volta a ser sem meter.
+        """
+        msg = ev.msg
+        datapath = msg.datapath
+        ofproto = datapath.ofproto
+        if msg.type == ofproto.OFPET_METER_MOD_FAILED and datapath.id not in self.no_meters:
+            self.no_meters.add(datapath.id)
+            self.logger.info("[PUNT] dpid=%s sem suporte a meters (code=%s); table-miss sem meter",
+                             datapath.id, msg.code)
+            with self.flow_batch("sem meter dpid=%s" % datapath.id):
+                self._install_table_miss(datapath)
+                # Regras de broadcast das bordas também saem sem meter
+                self.flood_sets.pop(datapath.id, None)
+                self._update_flood_tree()
+            return
+
+        key = (datapath.id, msg.xid)
+        pending = self.open_bundles.get(key)
+        if pending is None:
+            self.logger.info("[OFP] erro dpid=%s type=%s code=%s xid=%s",
+                             datapath.id, msg.type, msg.code, msg.xid)
+            return
+        # A bundle inteira foi descartada: erros seguintes dela (ADD/COMMIT)
+        # já não casam e são só logados
+        for bundle_key in pending["keys"]:
+            self.open_bundles.pop(bundle_key, None)
+
+        if key == pending["open"]:
+            # OPEN recusado: switch sem bundles, não tenta mais
+            self.no_bundles.add(datapath.id)
+        self.logger.info("[BATCH] dpid=%s recusou bundle (type=%s code=%s); reenviando %d "
+                         "mensagens sem bundle", datapath.id, msg.type, msg.code, len(pending["msgs"]))
+        for queued in pending["msgs"]:
+            datapath.send_msg(queued)
+        if not pending["batch"]["done"]:
+            self._send_barrier(datapath, pending["batch"])
+
     @set_ev_cls(ofp_event.EventOFPPacketIn, MAIN_DISPATCHER)
     def _packet_in_handler(self, ev):
+        """Despacha o packet-in para a fila do worker do switch (ou trata direto, sem workers)."""
+        if not self.pi_queues:
+            self._handle_packet_in(ev)
+            return
+
+        shard = ev.msg.datapath.id % len(self.pi_queues)
+        queue = self.pi_queues[shard]
+        depth = queue.qsize()
+        if depth >= PACKET_IN_QUEUE_MAX:
+            self.counters["pi_queue_drops"] += 1
+            return
+        queue.put(ev)
+        self.counters["pi_queued"] += 1
+        if depth + 1 > self.pi_queue_peak[shard]:
+            self.pi_queue_peak[shard] = depth + 1
+
+    def _packet_in_worker(self, shard: int):
+        """Consome a fila do shard, um packet-in por vez (ordem preservada por switch)."""
+        queue = self.pi_queues[shard]
+        while True:
+            ev = queue.get()
+            try:
+                self._handle_packet_in(ev)
+            except Exception:
+                self.logger.exception("[PACKET_IN] worker %d: erro tratando packet-in", shard)
+
+    def _handle_packet_in(self, ev):
         """Tratamento de pacotes enviados ao controlador (packet-in)."""
         msg = ev.msg
         datapath = msg.datapath
@@ -262,98 +1844,130 @@ class SimpleSwitch13(app_manager.RyuApp):
         parser = datapath.ofproto_parser
 
         in_port = msg.match['in_port']
+        self.counters["packet_in"] += 1
 
-        # Decodificar o pacote
-        pkt = packet.Packet(msg.data)
-        eth = pkt.get_protocol(ethernet.ethernet)
+        # Decodificar o pacote (só os campos usados abaixo)
+        fields = self._classify(msg.data)
+        if fields is None:
+            return
 
         # Ignora LLDP (usado para descoberta de topologia)
-        if eth.ethertype == 0x88cc:
+        if fields.eth_type == ETH_TYPE_LLDP:
             return
 
-        dst = eth.dst
-        src = eth.src
+        dst = fields.eth_dst
+        src = fields.eth_src
+
+        # Origem mandando packet-ins demais: descarta antes de qualquer trabalho
+        if PUNT_PROTECTION and not self._punt_admit(datapath, in_port, src):
+            return
 
         # Mantém o log original (requisito de manter as saídas/prints)
         self.logger.info("PACKET_IN dpid=%s src=%s dst=%s in_port=%s",
                          dpid, src, dst, in_port)
 
-        # Inicializa tabela para este switch se ainda não existir
-        self.mac_to_port.setdefault(dpid, {})
-
         # Aprende MAC de origem -> porta de entrada
-        self.mac_to_port[dpid][src] = in_port
+        old_port = self.mac_table.learn(dpid, src, in_port)
+        if old_port is not None and not self.routing.is_link_port(dpid, in_port):
+            # Host mudou de porta: fluxos do learning-switch ainda mandam para a antiga.
+            # Chegando por enlace entre switches não é mudança: é cópia de flood
+            self.logger.info("[MAC] dpid=%s %s mudou da porta %s para %s", dpid, src, old_port, in_port)
+            self._del_policy(datapath, POLICY_LEARNING, match=parser.OFPMatch(eth_dst=src))
+
+        # Localização do host na borda, para os caminhos fim a fim
+        known_at = self.routing.hosts.get(src)
+        if self.routing.learn_host(src, dpid, in_port):
+            # Host mudou de lugar: caminhos até ele estão errados
+            self.logger.info("[ROUTE] host %s mudou para dpid=%s port=%s", src, dpid, in_port)
+            self._drop_paths(lambda key, path: src in key)
+        if FORWARDING == "dst" and self.routing.hosts.get(src) != known_at:
+            # Host novo (ou movido): regra por destino em todos os switches
+            self._install_dst_rules([src])
+
+        # Cópia do broadcast já inundado pelo grupo do switch: só aprendizado
+        if msg.cookie >> COOKIE_POLICY_SHIFT == POLICY_FLOOD:
+            return
+
+        # Roteamento por menor caminho em qualquer topologia
+        if ROUTING == "shortest" and self._route_shortest(msg, datapath, in_port, src, dst):
+            return
 
         # -----------------------------
         # Regras específicas QUIC-sim (Exp. 4 / 5)
         # -----------------------------
-        if self._is_quic_packet(pkt):
-            out_port = self._route_quic_out_port(dpid, src_mac=src, in_port=in_port)
+        if self._is_quic_packet(fields):
+            # Exp. 4 te: na borda de origem, cada fluxo tem regra e caminho próprios
+            if self._te_enabled() and ECMP_EDGES.get(dpid) == src and dst in ECMP_EDGES.values():
+                client_port = fields.src_port if src == H2_MAC else fields.dst_port
+                actions = self._te_install_flow(datapath, src, dst, client_port)
+                self._packet_out(datapath, msg, in_port, actions)
+                return
 
-            if out_port is not None:
-                actions = [parser.OFPActionOutput(out_port)]
+            actions = self._quic_actions(parser, dpid, src_mac=src, in_port=in_port)
 
-                # Instalamos duas regras para cobrir os dois sentidos do fluxo QUIC-sim:
-                # - udp_dst=4433 (pacotes do cliente para o servidor)
-                # - udp_src=4433 (respostas do servidor)
+            if actions is not None:
+                # Uma regra por sentido do fluxo QUIC-sim:
+                # - h2->h1: udp_dst=4433 (pacotes do cliente para o servidor)
+                # - h1->h2: udp_src=4433 (respostas do servidor)
                 #
                 # Como não fazemos parsing de payload, só L2/L3/L4.
-                match_dst = parser.OFPMatch(
-                    eth_type=0x0800,
-                    ip_proto=17,
-                    udp_dst=QUIC_UDP_PORT
-                )
-                match_src = parser.OFPMatch(
-                    eth_type=0x0800,
-                    ip_proto=17,
-                    udp_src=QUIC_UDP_PORT
-                )
+                match = self._quic_direction_match(parser, src, dst)
+
+                # Exp. 4 aleatório: regra curta, o próximo packet-in sorteia de novo
+                hard_timeout = 0
+                if EXPERIMENT == 4 and ECMP_MODE == "random":
+                    hard_timeout = ECMP_RANDOM_HARD_TIMEOUT
 
                 # Prioridade 200: acima do learning-switch (prioridade 1).
                 # Assim, QUIC-sim respeita as políticas do experimento.
-                self.add_flow(datapath, 200, match_dst, actions)
-                self.add_flow(datapath, 200, match_src, actions)
+                if match is not None:
+                    self.add_flow(datapath, 200, match, actions, hard_timeout=hard_timeout,
+                                  cookie=self._cookie(POLICY_QUIC))
 
                 # Packet-out do pacote atual
-                data = msg.data if msg.buffer_id == ofproto.OFP_NO_BUFFER else None
-                out = parser.OFPPacketOut(
-                    datapath=datapath,
-                    buffer_id=msg.buffer_id,
-                    in_port=in_port,
-                    actions=actions,
-                    data=data
-                )
-                datapath.send_msg(out)
+                self._packet_out(datapath, msg, in_port, actions)
                 return
             # Se não conseguimos decidir (dpid inesperado), cai no learning-switch.
 
+        # -----------------------------
+        # Encaminhamento por destino (FORWARDING=dst)
+        # -----------------------------
+        if FORWARDING == "dst":
+            out_port = self._dst_out_port(dpid, dst)
+            if out_port is None:
+                self._flood_tree(msg, datapath, in_port)
+            else:
+                # Regra já instalada (ou a caminho): só entrega este pacote
+                self._packet_out(datapath, msg, in_port, [parser.OFPActionOutput(out_port)])
+            return
+
         # -----------------------------
         # Learning-switch (baseline)
         # -----------------------------
-        if dst in self.mac_to_port[dpid]:
-            out_port = self.mac_to_port[dpid][dst]
-        else:
+        # Destino já localizado: caminho inteiro de uma vez, em vez de um
+        # packet-in por salto
+        if self._route_path(msg, datapath, in_port, src, dst):
+            return
+
+        out_port = self.mac_table.lookup(dpid, dst)
+        if out_port is None and FLOOD_TREE:
+            self._flood_tree(msg, datapath, in_port)
+            return
+        if out_port is None:
             out_port = ofproto.OFPP_FLOOD
 
         actions = [parser.OFPActionOutput(out_port)]
 
         # Se já sabemos a porta de saída e não é FLOOD, instalamos fluxo
         if out_port != ofproto.OFPP_FLOOD:
-            match = parser.OFPMatch(in_port=in_port, eth_dst=dst, eth_src=src)
+            match = self._learning_match(parser, in_port, src, dst)
 
+            cookie = self._cookie(POLICY_LEARNING)
             if msg.buffer_id != ofproto.OFP_NO_BUFFER:
-                self.add_flow(datapath, 1, match, actions, msg.buffer_id)
+                self.add_flow(datapath, 1, match, actions, msg.buffer_id, cookie=cookie)
                 return
             else:
-                self.add_flow(datapath, 1, match, actions)
+                self.add_flow(datapath, 1, match, actions, cookie=cookie)
 
         # Envia o pacote atual (packet-out)
-        data = msg.data if msg.buffer_id == ofproto.OFP_NO_BUFFER else None
-        out = parser.OFPPacketOut(
-            datapath=datapath,
-            buffer_id=msg.buffer_id,
-            in_port=in_port,
-            actions=actions,
-            data=data
-        )
-        datapath.send_msg(out)
+        self._packet_out(datapath, msg, in_port, actions)
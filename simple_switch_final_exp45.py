@@ -12,12 +12,15 @@ from __future__ import annotations
 
 import os
 import random
+import time
+from collections import OrderedDict
 from typing import Dict, Optional, Tuple
 
 from ryu.base import app_manager
 from ryu.controller import ofp_event
 from ryu.controller.handler import CONFIG_DISPATCHER, MAIN_DISPATCHER, set_ev_cls
 from ryu.ofproto import ofproto_v1_3
+from ryu.lib import hub
 from ryu.lib.packet import packet
 from ryu.lib.packet import ethernet
 from ryu.lib.packet import arp
@@ -25,6 +28,8 @@ from ryu.lib.packet import ipv4
 from ryu.lib.packet import udp
 from ryu.lib.packet import ether_types
 
+from mac_table import MacTable
+
 
 # -----------------------------
 # Configuração de Experimentos
@@ -38,6 +43,18 @@ QUIC_UDP_PORT = 4433
 H1_MAC = os.environ.get("H1_MAC", "00:00:00:00:00:01")
 H2_MAC = os.environ.get("H2_MAC", "00:00:00:00:00:02")
 
+# Memória limitada: tabela MAC com envelhecimento/LRU (mac_table.py) e
+# anti-storm de ARP que esquece (dpid, IP) depois de SEEN_ARP_TTL s
+MAC_TABLE_SIZE = int(os.environ.get("MAC_TABLE_SIZE", "4096"))
+MAC_AGING_TIME = int(os.environ.get("MAC_AGING_TIME", "300"))
+MAC_AGING_INTERVAL = int(os.environ.get("MAC_AGING_INTERVAL", "10"))
+SEEN_ARP_MAX = 4096
+SEEN_ARP_TTL = 30
+
+# Cookie das regras do learning-switch (prioridade 1): host que muda de
+# porta apaga só elas, não as regras QUIC (prioridade 200/300)
+LEARNING_COOKIE = 1
+
 # -----------------------------
 # Mapeamento de portas (DEFAULT)
 # -----------------------------
@@ -67,7 +84,7 @@ class SimpleSwitch13(app_manager.RyuApp):
     def __init__(self, *args, **kwargs):
         super(SimpleSwitch13, self).__init__(*args, **kwargs)
 
-        self.mac_to_port: Dict[int, Dict[str, int]] = {}
+        self.mac_table = MacTable(MAC_TABLE_SIZE, MAC_AGING_TIME)
         self.port_state: Dict[Tuple[int, int], bool] = {}
         self.datapaths: Dict[int, object] = {}
         self.ports = DEFAULT_PORTS
@@ -76,7 +93,10 @@ class SimpleSwitch13(app_manager.RyuApp):
             '10.0.0.1': '00:00:00:00:00:01',
             '10.0.0.2': '00:00:00:00:00:02',
         }
-        self.seen_arp: set = set()
+        # (dpid, src_ip) -> instante do último flood de ARP (ordem de inserção = mais antigo primeiro)
+        self.seen_arp: "OrderedDict[Tuple[int, str], float]" = OrderedDict()
+
+        self.aging_thread = hub.spawn(self._age_mac_table)
 
         self.logger.info("== Controlador iniciado (EXPERIMENT=%s) ==", EXPERIMENT)
 
@@ -115,6 +135,7 @@ class SimpleSwitch13(app_manager.RyuApp):
         idle_timeout: int = 0,
         hard_timeout: int = 0,
         buffer_id=None,
+        cookie: int = 0,
 ):
         """Instala uma regra de fluxo no switch."""
         ofproto = datapath.ofproto
@@ -129,15 +150,18 @@ class SimpleSwitch13(app_manager.RyuApp):
             instructions=inst,
             idle_timeout=idle_timeout,
             hard_timeout=hard_timeout,
+            cookie=cookie,
         )
         datapath.send_msg(mod)
 
-    def del_flow(self, datapath, match):
-        """Remove flows que casam com o match (DELETE)."""
+    def del_flow(self, datapath, match, cookie: int = 0, cookie_mask: int = 0):
+        """Remove flows que casam com o match (DELETE); com cookie_mask, só os desse cookie."""
         ofproto = datapath.ofproto
         parser = datapath.ofproto_parser
         mod = parser.OFPFlowMod(
             datapath=datapath,
+            cookie=cookie,
+            cookie_mask=cookie_mask,
             command=ofproto.OFPFC_DELETE,
             out_port=ofproto.OFPP_ANY,
             out_group=ofproto.OFPG_ANY,
@@ -145,12 +169,32 @@ class SimpleSwitch13(app_manager.RyuApp):
         )
         datapath.send_msg(mod)
 
+    def _age_mac_table(self):
+        """A cada MAC_AGING_INTERVAL s, expira MACs antigos e apaga seus fluxos do learning-switch."""
+        while True:
+            hub.sleep(MAC_AGING_INTERVAL)
+            expired = self.mac_table.expire()
+            for dpid, mac, _port in expired:
+                dp = self.datapaths.get(dpid)
+                if dp is not None:
+                    self.del_flow(dp, dp.ofproto_parser.OFPMatch(eth_dst=mac),
+                                  cookie=LEARNING_COOKIE, cookie_mask=0xFFFFFFFFFFFFFFFF)
+            if expired:
+                self.logger.info("[MAC] %d entradas (expiradas=%d, expulsas=%d, movidas=%d)",
+                                 len(self.mac_table), self.mac_table.expirations,
+                                 self.mac_table.evictions, self.mac_table.moves)
+
     # -----------------------------
     # Estado/roteamento
     # -----------------------------
     def _is_port_up(self, dpid: int, port_no: int) -> bool:
         return self.port_state.get((dpid, port_no), True)
 
+    def _is_link_port(self, dpid: int, port_no: int) -> bool:
+        """Porta entre switches (to_sN em DEFAULT_PORTS)."""
+        return any(name.startswith("to_s") and port == port_no
+                   for name, port in self.ports.get(dpid, {}).items())
+
     def _is_link_s1_s2_up(self) -> bool:
         p_s1_to_s2 = self.ports[1]["to_s2"]
         p_s2_to_s1 = self.ports[2]["to_s1"]
@@ -336,8 +380,14 @@ class SimpleSwitch13(app_manager.RyuApp):
         self.logger.info("PACKET_IN dpid=%s src=%s dst=%s in_port=%s", dpid, src, dst, in_port)
 
         # learning table
-        self.mac_to_port.setdefault(dpid, {})
-        self.mac_to_port[dpid][src] = in_port
+        old_port = self.mac_table.learn(dpid, src, in_port)
+        if old_port is not None and not (self._is_link_port(dpid, old_port)
+                                         and self._is_link_port(dpid, in_port)):
+            # host mudou de porta: remove as regras do learning-switch que
+            # ainda apontam para a antiga. Entre duas portas de enlace não é
+            # mudança: são cópias de flood chegando pelos dois lados do anel
+            self.del_flow(datapath, parser.OFPMatch(eth_dst=src),
+                          cookie=LEARNING_COOKIE, cookie_mask=0xFFFFFFFFFFFFFFFF)
 
         # --- ARP (evita broadcast storm em topologia em malha) ---
         if eth.ethertype == ether_types.ETH_TYPE_ARP:
@@ -376,9 +426,13 @@ class SimpleSwitch13(app_manager.RyuApp):
             # fallback: se não conhecemos, envia para o controlador só uma vez por switch+src_ip
             # (reduz tempestade em malha)
             key = (dpid, getattr(arp_pkt, "src_ip", src))
-            if key in self.seen_arp:
+            now = time.time()
+            if now - self.seen_arp.get(key, 0) < SEEN_ARP_TTL:
                 return
-            self.seen_arp.add(key)
+            self.seen_arp.pop(key, None)
+            self.seen_arp[key] = now
+            if len(self.seen_arp) > SEEN_ARP_MAX:
+                self.seen_arp.popitem(last=False)
 
             actions = [parser.OFPActionOutput(ofproto.OFPP_FLOOD)]
             self._packet_out(datapath, msg, in_port, actions)
@@ -417,9 +471,8 @@ class SimpleSwitch13(app_manager.RyuApp):
             # se não decide, cai no baseline
 
         # --- BASELINE learning-switch ---
-        if dst in self.mac_to_port[dpid]:
-            out_port = self.mac_to_port[dpid][dst]
-        else:
+        out_port = self.mac_table.lookup(dpid, dst)
+        if out_port is None:
             out_port = ofproto.OFPP_FLOOD
 
         actions = [parser.OFPActionOutput(out_port)]
@@ -427,9 +480,10 @@ class SimpleSwitch13(app_manager.RyuApp):
         if out_port != ofproto.OFPP_FLOOD:
             match = parser.OFPMatch(in_port=in_port, eth_src=src, eth_dst=dst)
             if msg.buffer_id != ofproto.OFP_NO_BUFFER:
-                self.add_flow(datapath, 1, match, actions, buffer_id=msg.buffer_id)
+                self.add_flow(datapath, 1, match, actions, buffer_id=msg.buffer_id,
+                              cookie=LEARNING_COOKIE)
                 return
             else:
-                self.add_flow(datapath, 1, match, actions)
+                self.add_flow(datapath, 1, match, actions, cookie=LEARNING_COOKIE)
 
         self._packet_out(datapath, msg, in_port, actions)
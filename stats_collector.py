@@ -0,0 +1,177 @@
+# stats_collector.py
+#
+# Taxas por fluxo, por porta e matriz de tráfego a partir dos contadores
+# OpenFlow (flow stats / port stats) que o simple_switch_final.py pede aos
+# switches, no lugar de "ovs-ofctl dump-flows" manual (how-to-experimental.md, seção 7):
+#
+#   - taxa = diferença de bytes entre duas amostras / intervalo entre elas
+#   - histórico em ring buffers (deque com maxlen): por porta, por fluxo e
+#     fotos da matriz de tráfego (src MAC, dst MAC) -> bps
+#   - intervalo de coleta adaptativo por switch: switch com porta acima de
+#     busy_bps volta para min_interval; ocioso, o intervalo dobra até
+#     max_interval (coleta não inunda o canal de controle)
+#
+# Não depende do Ryu.
+
+from __future__ import annotations
+
+from collections import deque
+from typing import Deque, Dict, Hashable, List, Optional, Tuple
+
+# (instante, bps)
+Sample = Tuple[float, float]
+
+
+class StatsCollector:
+    """Amostras de contadores -> taxas, históricos e matriz de tráfego."""
+
+    def __init__(self, min_interval: float = 1.0, max_interval: float = 16.0,
+                 busy_bps: float = 1e6, history: int = 60):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.busy_bps = busy_bps
+        self.history = history
+
+        # (dpid, port) -> (instante, tx_bytes, rx_bytes, tx_dropped) da última amostra
+        self._port_last: Dict[Tuple[int, int], Tuple[float, int, int, int]] = {}
+        # (dpid, port) -> ring de (instante, bps transmitidos)
+        self.port_rates: Dict[Tuple[int, int], Deque[Sample]] = {}
+        # (dpid, port) -> ring de (instante, pacotes descartados na fila de saída por s)
+        self.port_drops: Dict[Tuple[int, int], Deque[Sample]] = {}
+
+        # (dpid, chave do fluxo) -> (instante, bytes, duração)
+        self._flow_last: Dict[Tuple[int, Hashable], Tuple[float, int, float]] = {}
+        # (dpid, chave do fluxo) -> ring de (instante, bps)
+        self.flow_rates: Dict[Tuple[int, Hashable], Deque[Sample]] = {}
+        # (dpid, chave do fluxo) -> par (src, dst) do fluxo, para a matriz
+        self._flow_pair: Dict[Tuple[int, Hashable], Tuple[str, str]] = {}
+        # dpid -> fluxos vistos nas partes anteriores de um reply multipart
+        self._seen_parts: Dict[int, set] = {}
+
+        # Ring de fotos da matriz: (instante, {(src, dst): bps})
+        self.matrix_history: Deque[Tuple[float, Dict[Tuple[str, str], float]]] = deque(maxlen=history)
+
+        # dpid -> intervalo atual e instante da próxima coleta
+        self.interval: Dict[int, float] = {}
+        self.next_poll: Dict[int, float] = {}
+
+    # -----------------------------
+    # Agendamento adaptativo
+    # -----------------------------
+    def due(self, dpid: int, now: float) -> bool:
+        return now >= self.next_poll.get(dpid, 0.0)
+
+    def polled(self, dpid: int, now: float):
+        """Coleta enviada: próxima só depois do intervalo atual do switch."""
+        interval = self.interval.setdefault(dpid, self.min_interval)
+        self.next_poll[dpid] = now + interval
+
+    def _adapt(self, dpid: int, busy: bool):
+        if busy:
+            self.interval[dpid] = self.min_interval
+        else:
+            self.interval[dpid] = min(self.interval.get(dpid, self.min_interval) * 2,
+                                      self.max_interval)
+
+    # -----------------------------
+    # Portas
+    # -----------------------------
+    def update_ports(self, dpid: int, samples: List[Tuple[int, int, int, int]], now: float):
+        """samples: [(porta, tx_bytes, rx_bytes, tx_dropped), ...] de um port stats reply."""
+        busy = False
+        for port, tx_bytes, rx_bytes, tx_dropped in samples:
+            key = (dpid, port)
+            last = self._port_last.get(key)
+            self._port_last[key] = (now, tx_bytes, rx_bytes, tx_dropped)
+            if last is None or now <= last[0] or tx_bytes < last[1]:
+                continue
+            elapsed = now - last[0]
+            bps = (tx_bytes - last[1]) * 8 / elapsed
+            self.port_rates.setdefault(key, deque(maxlen=self.history)).append((now, bps))
+            drops = max(tx_dropped - last[3], 0) / elapsed
+            self.port_drops.setdefault(key, deque(maxlen=self.history)).append((now, drops))
+            busy = busy or bps >= self.busy_bps
+        self._adapt(dpid, busy)
+
+    def port_rate(self, dpid: int, port: int) -> float:
+        ring = self.port_rates.get((dpid, port))
+        return ring[-1][1] if ring else 0.0
+
+    def port_drop_rate(self, dpid: int, port: int) -> float:
+        ring = self.port_drops.get((dpid, port))
+        return ring[-1][1] if ring else 0.0
+
+    # -----------------------------
+    # Fluxos
+    # -----------------------------
+    def update_flows(self, dpid: int, samples: List[Tuple[Hashable, Optional[Tuple[str, str]], int, float]],
+                     now: float, complete: bool = True):
+        """
+        samples: [(chave, (src, dst) ou None, byte_count, duração em s), ...].
+        complete=True na última parte do reply: fluxos do switch que não
+        vieram mais são esquecidos.
+        """
+        seen = set()
+        for flow_key, pair, byte_count, duration in samples:
+            key = (dpid, flow_key)
+            seen.add(key)
+            last = self._flow_last.get(key)
+            self._flow_last[key] = (now, byte_count, duration)
+            if pair is not None:
+                self._flow_pair[key] = pair
+
+            if last is None or byte_count < last[1] or duration < last[2]:
+                # Fluxo novo (ou reinstalado): média desde a instalação
+                bps = byte_count * 8 / duration if duration > 0 else 0.0
+            elif now > last[0]:
+                bps = (byte_count - last[1]) * 8 / (now - last[0])
+            else:
+                continue
+            self.flow_rates.setdefault(key, deque(maxlen=self.history)).append((now, bps))
+
+        if not complete:
+            self._seen_parts.setdefault(dpid, set()).update(seen)
+            return
+        seen |= self._seen_parts.pop(dpid, set())
+        for key in [k for k in self._flow_last if k[0] == dpid and k not in seen]:
+            self._flow_last.pop(key, None)
+            self.flow_rates.pop(key, None)
+            self._flow_pair.pop(key, None)
+
+    def flow_rate(self, dpid: int, flow_key: Hashable) -> float:
+        ring = self.flow_rates.get((dpid, flow_key))
+        return ring[-1][1] if ring else 0.0
+
+    # -----------------------------
+    # Matriz de tráfego
+    # -----------------------------
+    def matrix(self) -> Dict[Tuple[str, str], float]:
+        """
+        (src, dst) -> bps atual. Num switch, os fluxos do par se somam; entre
+        switches vale o maior valor (o mesmo tráfego não é somado salto a salto).
+        """
+        per_switch: Dict[Tuple[int, Tuple[str, str]], float] = {}
+        for key, pair in self._flow_pair.items():
+            ring = self.flow_rates.get(key)
+            per_switch[(key[0], pair)] = per_switch.get((key[0], pair), 0.0) + (ring[-1][1] if ring else 0.0)
+
+        result: Dict[Tuple[str, str], float] = {}
+        for (_dpid, pair), bps in per_switch.items():
+            if bps > result.get(pair, -1.0):
+                result[pair] = bps
+        return result
+
+    def snapshot(self, now: float) -> Dict[Tuple[str, str], float]:
+        """Guarda a matriz atual no ring de histórico e a retorna."""
+        current = self.matrix()
+        self.matrix_history.append((now, current))
+        return current
+
+    def forget_switch(self, dpid: int):
+        for table in (self._port_last, self.port_rates, self.port_drops,
+                      self._flow_last, self.flow_rates, self._flow_pair):
+            for key in [k for k in table if k[0] == dpid]:
+                del table[key]
+        self.interval.pop(dpid, None)
+        self.next_poll.pop(dpid, None)
+        self._seen_parts.pop(dpid, None)
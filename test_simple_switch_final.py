@@ -0,0 +1,60 @@
+# test_simple_switch_final.py
+#
+# Testes do controlador simple_switch_final.py sem switch real: só a lógica
+# de decisão, sem datapaths conectados. Precisa do Ryu instalado.
+
+import pytest
+
+pytest.importorskip("ryu")
+
+import simple_switch_final as S  # noqa: E402
+
+
+@pytest.fixture
+def te_app(monkeypatch):
+    """Controlador no Exp. 4 com ECMP_MODE=te, sem workers de packet-in."""
+    monkeypatch.setattr(S, "EXPERIMENT", 4)
+    monkeypatch.setattr(S, "ECMP_MODE", "te")
+    monkeypatch.setattr(S, "PACKET_IN_WORKERS", 0)
+    return S.SimpleSwitch13()
+
+
+def test_choose_ecmp_port_te_prefers_least_loaded_path(te_app):
+    p = te_app.ports[1]
+    candidates = (p["to_s2"], p["to_s3"])
+
+    # Caminho via s2 carregado: escolhe s3
+    te_app.te_pending[(1, p["to_s2"])] = 1e9
+    assert te_app._choose_ecmp_port(1, candidates) == p["to_s3"]
+
+    # Agora via s3 carregado: escolhe s2
+    te_app.te_pending[(1, p["to_s2"])] = 0.0
+    te_app.te_pending[(1, p["to_s3"])] = 1e9
+    assert te_app._choose_ecmp_port(1, candidates) == p["to_s2"]
+
+
+def test_choose_ecmp_port_te_skips_down_port(te_app):
+    p = te_app.ports[1]
+    candidates = (p["to_s2"], p["to_s3"])
+    te_app.te_pending[(1, p["to_s3"])] = 0.0
+    te_app.te_pending[(1, p["to_s2"])] = 1e9
+    te_app.port_state[(1, p["to_s3"])] = False
+    assert te_app._choose_ecmp_port(1, candidates) == p["to_s2"]
+
+
+def test_age_mac_table_drops_paths_of_forgotten_hosts(monkeypatch):
+    monkeypatch.setattr(S, "PACKET_IN_WORKERS", 0)
+    app = S.SimpleSwitch13()
+    a, b, c = "00:00:00:00:00:0a", "00:00:00:00:00:0b", "00:00:00:00:00:0c"
+    for mac, port in ((a, 1), (b, 2), (c, 3)):
+        app.mac_table.learn(1, mac, port, now=0.0)
+        app.routing.hosts[mac] = (1, port)
+    app.installed_paths[(a, b)] = [(1, 2)]
+    app.installed_paths[(b, c)] = [(1, 3)]
+
+    # Só b continua ativo: a e c expiram e levam os caminhos junto
+    app.mac_table.learn(1, b, 2, now=S.MAC_AGING_TIME)
+    app._age_mac_table(S.MAC_AGING_TIME + 1.0)
+
+    assert set(app.routing.hosts) == {b}
+    assert app.installed_paths == {}
@@ -1,17 +1,28 @@
 # udp_client_final.py
 #
 # Cliente "QUIC-sim" baseado em UDP:
-# - Envia handshake + vários pacotes "data"
+# - Envia handshake + vários pacotes "data" (stream de mensagens)
 # - Cada pacote tem seq
-# - Mede RTT
-# - Retransmite em caso de timeout
+# - Mede RTT e adapta o timeout (RTO estilo RFC 6298: SRTT/RTTVAR, Karn, backoff)
+# - Retransmite em caso de timeout e, com SACK, antes dele (fast retransmit)
+# - Controle de congestionamento plugável (NewReno ou CUBIC)
+# - Envia os arquivos com janela deslizante (vários chunks em voo)
+# - Vários arquivos e um stream de mensagens numa só conexão: streams
+#   declarados no handshake, escalonados em round-robin, com crédito por stream
+# - Negocia no handshake o formato binário dos chunks (fallback: JSON+base64)
+# - Lê o arquivo via mmap: cada chunk é um memoryview criado só na hora do envio
 import base64
+import contextlib
+import mmap
 import os
+import random
+import struct
 
 
 import socket
 import json
 import time
+from collections import deque
 
 # Ajustar este IP para o IP do servidor visto de dentro do Mininet.
 # Em laboratório simples, vamos começar assumindo que o servidor
@@ -20,23 +31,284 @@ import time
 SERVER_IP = "10.0.0.1"
 SERVER_PORT = 4433
 
-TIMEOUT = 1.0       # timeout para esperar ACK
-MAX_RETRIES = 3     # retransmissões por pacote
+TIMEOUT = 1.0       # timeout inicial para esperar ACK (RTO antes da 1ª amostra)
+MAX_RETRIES = 8     # tentativas por pacote (com backoff exponencial do RTO)
+
+# RTO adaptativo (RFC 6298): limites e granularidade do relógio
+MIN_RTO = 0.2
+MAX_RTO = 8.0
+CLOCK_GRANULARITY = 0.001
 NUM_DATA_PKTS = 5   # quantos pacotes de dados enviar
 
 FILE_TO_SEND = "teste_sdn.txt"  # ajuste para o arquivo que você quiser
-CHUNK_SIZE = 1024                   # bytes por chunk
+FILES_TO_SEND = [FILE_TO_SEND]      # em paralelo, um stream cada (servidor sem streams: um por vez)
+CHUNK_SIZE = 1024                   # bytes por chunk (formato JSON+base64)
+BIN_CHUNK_SIZE = 1400               # bytes por chunk no formato binário (cabe na MTU 1500)
+WINDOW_SIZE = 64                    # máximo de chunks sem ACK em voo (1 = stop-and-wait)
+
+# Controle de congestionamento: "newreno", "cubic" ou "none" (janela fixa
+# = WINDOW_SIZE). A janela efetiva é min(WINDOW_SIZE, cwnd).
+CC_ALGORITHM = "newreno"
+INITIAL_CWND = 10                   # janela inicial em chunks (RFC 6928)
+MIN_CWND = 2
+# Um chunk é dado como perdido quando já há ACK de um seq LOSS_REORDER_THRESHOLD
+# posições à frente (equivale aos 3 ACKs duplicados do fast retransmit).
+LOSS_REORDER_THRESHOLD = 3
+
+# -----------------------------
+# Formato binário dos chunks ("bin2")
+# -----------------------------
+# Cabeçalho fixo (big-endian) seguido do payload cru, sem base64:
+#   magic(1) versão(1) tipo(1) conn_id(4) stream(2) seq(4) índice(4) total(4) offset(8) tamanho(2)
+# seq é o número de pacote da conexão (comum a todos os streams, é o que o
+# servidor confirma); índice é a posição do chunk dentro do stream.
+# O magic 0x51 ("Q") nunca é o primeiro byte de um JSON ("{"), então o
+# servidor distingue os dois formatos pelo primeiro byte do datagrama.
+WIRE_FORMATS = ["bin2", "json"]     # ordem de preferência oferecida no handshake
+WIRE_MAGIC = 0x51
+WIRE_VERSION = 2
+WIRE_HEADER = struct.Struct("!BBBIHIIIQH")
+PKT_FILE_CHUNK = 1
+
+
+class RttEstimator:
+    """
+    Estimador de RTT/RTO da RFC 6298:
+      SRTT   <- (1 - 1/8) * SRTT + 1/8 * R
+      RTTVAR <- (1 - 1/4) * RTTVAR + 1/4 * |SRTT - R|
+      RTO    <- SRTT + max(G, 4 * RTTVAR), limitado a [min_rto, max_rto]
+    Amostras de pacotes retransmitidos devem ser descartadas pelo chamador
+    (algoritmo de Karn); cada timeout dobra o RTO (backoff exponencial).
+    """
+
+    ALPHA = 1 / 8
+    BETA = 1 / 4
+    K = 4
+
+    def __init__(self, initial_rto=TIMEOUT, min_rto=MIN_RTO, max_rto=MAX_RTO,
+                 granularity=CLOCK_GRANULARITY):
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.granularity = granularity
+        self.srtt = None
+        self.rttvar = None
+        self.rto = initial_rto
+        self.backoffs = 0
+        self.samples = 0
+
+    def on_sample(self, rtt):
+        """Nova amostra de RTT (só de pacotes não retransmitidos)."""
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - self.BETA) * self.rttvar + self.BETA * abs(self.srtt - rtt)
+            self.srtt = (1 - self.ALPHA) * self.srtt + self.ALPHA * rtt
+        self.samples += 1
+        self.backoffs = 0
+        self.rto = self._clamp(self.srtt + max(self.granularity, self.K * self.rttvar))
+
+    def on_timeout(self):
+        """Timeout de retransmissão: backoff exponencial do RTO."""
+        self.backoffs += 1
+        self.rto = self._clamp(self.rto * 2)
+
+    def on_progress(self):
+        """
+        ACK de dado novo (mesmo retransmitido): o caminho voltou a entregar,
+        então desfaz o backoff sem usar a amostra ambígua (como o PTO do QUIC).
+        """
+        if self.backoffs and self.srtt is not None:
+            self.backoffs = 0
+            self.rto = self._clamp(self.srtt + max(self.granularity, self.K * self.rttvar))
+
+    def _clamp(self, rto):
+        return min(self.max_rto, max(self.min_rto, rto))
+
+    def state(self):
+        return {
+            "srtt": self.srtt,
+            "rttvar": self.rttvar,
+            "rto": self.rto,
+            "backoffs": self.backoffs,
+            "samples": self.samples,
+        }
+
+    def __str__(self):
+        if self.srtt is None:
+            return f"srtt=n/a rttvar=n/a rto={self.rto:.3f}s backoffs={self.backoffs}"
+        return (f"srtt={self.srtt:.3f}s rttvar={self.rttvar:.3f}s "
+                f"rto={self.rto:.3f}s backoffs={self.backoffs}")
+
+
+class CongestionController:
+    """
+    Interface dos controles de congestionamento; a janela (cwnd) é contada
+    em chunks. Perdas detectadas por SACK/ACK duplicado reduzem a janela
+    uma vez por "época de recuperação": até que seja confirmado um seq
+    posterior ao maior seq enviado no momento da perda.
+    Sem controle ("none"), a janela fica fixa em max_window.
+    """
+
+    name = "none"
+
+    def __init__(self, initial_window=INITIAL_CWND, max_window=WINDOW_SIZE):
+        self.max_window = max_window
+        self.cwnd = float(max_window)
+        self.ssthresh = float("inf")
+        self.recovery_point = None
+
+    def window(self):
+        return max(1, min(self.max_window, int(self.cwnd)))
+
+    def in_slow_start(self):
+        return self.cwnd < self.ssthresh
+
+    def on_ack(self, acked, largest_acked, rtt, now):
+        """acked chunks novos confirmados; largest_acked é o maior seq confirmado."""
+        if self.recovery_point is not None and largest_acked > self.recovery_point:
+            self.recovery_point = None
+
+    def on_loss(self, highest_sent, now):
+        """Perda por SACK/ACK duplicado. Retorna True se reduziu a janela."""
+        if self.recovery_point is not None:
+            return False
+        self.recovery_point = highest_sent
+        self._reduce(now)
+        return True
+
+    def on_timeout(self, now):
+        """Timeout de retransmissão (RTO)."""
+        self.recovery_point = None
+
+    def _reduce(self, now):
+        pass
+
+    def __str__(self):
+        ssthresh = "inf" if self.ssthresh == float("inf") else f"{self.ssthresh:.1f}"
+        return f"{self.name} cwnd={self.cwnd:.1f} ssthresh={ssthresh}"
+
+
+class NewReno(CongestionController):
+    """Slow start + AIMD (RFC 5681/6582): +1 chunk por RTT, metade na perda."""
+
+    name = "newreno"
+
+    def __init__(self, initial_window=INITIAL_CWND, max_window=WINDOW_SIZE):
+        super().__init__(initial_window, max_window)
+        self.cwnd = float(initial_window)
+
+    def on_ack(self, acked, largest_acked, rtt, now):
+        super().on_ack(acked, largest_acked, rtt, now)
+        if self.recovery_point is not None:
+            return
+        if self.in_slow_start():
+            self.cwnd += acked
+        else:
+            self.cwnd += acked / self.cwnd
+        self.cwnd = min(self.cwnd, float(self.max_window))
+
+    def _reduce(self, now):
+        self.ssthresh = max(self.cwnd / 2, MIN_CWND)
+        self.cwnd = self.ssthresh
+
+    def on_timeout(self, now):
+        super().on_timeout(now)
+        self.ssthresh = max(self.cwnd / 2, MIN_CWND)
+        self.cwnd = 1.0
+
+
+class Cubic(NewReno):
+    """
+    CUBIC (RFC 9438, C=0.4, beta=0.7): depois de uma perda, a janela cresce
+    como W(t) = C*(t - K)^3 + W_max, com K = cbrt(W_max*(1 - beta)/C), sem
+    ficar abaixo da estimativa "Reno-friendly" W_est. Slow start igual ao NewReno.
+    """
+
+    name = "cubic"
+    C = 0.4
+    BETA = 0.7
+
+    def __init__(self, initial_window=INITIAL_CWND, max_window=WINDOW_SIZE):
+        super().__init__(initial_window, max_window)
+        self.w_max = 0.0
+        self.w_est = 0.0
+        self.k = 0.0
+        self.epoch_start = None
+
+    def on_ack(self, acked, largest_acked, rtt, now):
+        CongestionController.on_ack(self, acked, largest_acked, rtt, now)
+        if self.recovery_point is not None:
+            return
+        if self.in_slow_start():
+            self.cwnd = min(self.cwnd + acked, float(self.max_window))
+            return
+
+        if self.epoch_start is None:
+            self.epoch_start = now
+            self.w_est = self.cwnd
+            if self.w_max < self.cwnd:
+                self.w_max = self.cwnd
+                self.k = 0.0
+
+        # Alvo um RTT à frente, limitado a [cwnd, 1.5*cwnd] (RFC 9438, 4.2)
+        t = now - self.epoch_start + (rtt or 0.0)
+        target = self.C * (t - self.k) ** 3 + self.w_max
+        target = min(max(target, self.cwnd), 1.5 * self.cwnd)
+        # W_est cresce como Reno com alpha_cubic até alcançar W_max (4.3)
+        alpha = 3 * (1 - self.BETA) / (1 + self.BETA) if self.w_est < self.w_max else 1.0
+        self.w_est += alpha * acked / self.cwnd
+
+        self.cwnd += (target - self.cwnd) / self.cwnd * acked
+        self.cwnd = min(max(self.cwnd, self.w_est), float(self.max_window))
+
+    def _reduce(self, now):
+        # Fast convergence: cedendo banda se a perda veio antes do W_max anterior
+        if self.cwnd < self.w_max:
+            self.w_max = self.cwnd * (1 + self.BETA) / 2
+        else:
+            self.w_max = self.cwnd
+        self.cwnd = max(self.cwnd * self.BETA, MIN_CWND)
+        self.ssthresh = self.cwnd
+        self.k = (self.w_max * (1 - self.BETA) / self.C) ** (1 / 3)
+        self.epoch_start = None
+
+    def on_timeout(self, now):
+        super().on_timeout(now)
+        self.epoch_start = None
+
+
+CONGESTION_CONTROLLERS = {
+    "none": CongestionController,
+    "newreno": NewReno,
+    "cubic": Cubic,
+}
+
+
+def make_congestion_controller(name=CC_ALGORITHM, max_window=WINDOW_SIZE):
+    """Instancia o controle de congestionamento configurado em CC_ALGORITHM."""
+    try:
+        cls = CONGESTION_CONTROLLERS[name]
+    except KeyError:
+        raise ValueError(f"CC_ALGORITHM desconhecido: {name!r} "
+                         f"(opções: {', '.join(CONGESTION_CONTROLLERS)})")
+    return cls(INITIAL_CWND, max_window)
 
 
 sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
 sock.settimeout(TIMEOUT)
 
+# Estimador de RTT compartilhado por todos os pacotes da conexão
+rtt_estimator = RttEstimator()
+
 
 def send_and_wait_ack(pkt, server_addr):
     """
-    Envia um pacote (com campo seq), aguarda ACK com timeout
-    e retransmite até MAX_RETRIES.
-    Retorna (ok, rtt) onde rtt é o RTT medido ou None se falhou.
+    Envia um pacote (com campo seq), aguarda ACK até o RTO atual
+    e retransmite até MAX_RETRIES, dobrando o RTO a cada timeout.
+    Só a primeira tentativa gera amostra de RTT (algoritmo de Karn).
+    Retorna (ok, rtt, resp) onde rtt é o RTT medido e resp o ACK
+    decodificado, ou (False, None, None) se falhou.
     """
     seq = pkt["seq"]
     attempts = 0
@@ -44,96 +316,561 @@ def send_and_wait_ack(pkt, server_addr):
     while attempts < MAX_RETRIES:
         attempts += 1
         send_time = time.time()
+        deadline = send_time + rtt_estimator.rto
         sock.sendto(json.dumps(pkt).encode(), server_addr)
         print(f"[SEND] seq={seq}, tentativa={attempts}")
 
+        # ACKs atrasados de outros pacotes não gastam a tentativa
+        while True:
+            try:
+                sock.settimeout(max(0.001, deadline - time.time()))
+                data, _ = sock.recvfrom(2048)
+                recv_time = time.time()
+                rtt = recv_time - send_time
+
+                resp = json.loads(data.decode())
+                if resp.get("type") in ("ack", "ack_chunk") and resp.get("seq") == seq:
+                    if attempts == 1:
+                        rtt_estimator.on_sample(rtt)
+                    print(f"[ACK OK] seq={seq}, rtt={rtt:.3f}s, resp={resp}")
+                    return True, rtt, resp
+                print(f"[ACK INVÁLIDO] resp={resp}")
+            except socket.timeout:
+                rtt_estimator.on_timeout()
+                print(f"[TIMEOUT] seq={seq} (tentativa {attempts}) [RTT] {rtt_estimator}")
+                break
+            except ValueError:
+                print(f"[ACK INVÁLIDO] raw={data!r}")
+
+    print(f"[FALHA] seq={seq} sem ACK após {MAX_RETRIES} tentativas")
+    return False, None, None
+
+class FileChunks:
+    """
+    Arquivo mapeado em memória (mmap) visto como sequência de chunks.
+    chunks[i] devolve um memoryview (sem cópia) criado sob demanda, então
+    o custo de abrir não depende do tamanho do arquivo e arquivos maiores
+    que a RAM podem ser enviados: o SO pagina só o que a janela está usando.
+    """
+
+    def __init__(self, filename, chunk_size=1024):
+        self.chunk_size = chunk_size
+        self._file = open(filename, "rb")
+        self.size = os.fstat(self._file.fileno()).st_size
+        # mmap não aceita arquivo vazio
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+        self._view = memoryview(self._map) if self._map is not None else memoryview(b"")
+
+    def __len__(self):
+        return (self.size + self.chunk_size - 1) // self.chunk_size
+
+    def __getitem__(self, i):
+        start = self.offset(i)
+        return self._view[start:start + self.chunk_size]
+
+    def offset(self, i):
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return i * self.chunk_size
+
+    def close(self):
+        self._view.release()
+        if self._map is not None:
+            self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class MessageChunks:
+    """Mensagens curtas vistas como chunks (uma mensagem por chunk), como FileChunks."""
+
+    def __init__(self, messages):
+        self._items = [m.encode() for m in messages]
+        self._offsets = []
+        self.size = 0
+        for item in self._items:
+            self._offsets.append(self.size)
+            self.size += len(item)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __getitem__(self, i):
+        return memoryview(self._items[i])
+
+    def offset(self, i):
+        return self._offsets[i]
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SendStream:
+    """
+    Um stream da conexão: arquivo (FileChunks) ou mensagens (MessageChunks).
+    credit é o índice limite (exclusivo) liberado pelo servidor; None quando
+    o servidor não tem controle de fluxo por stream.
+    """
+
+    def __init__(self, stream_id, kind, name, chunks, credit=None):
+        self.id = stream_id
+        self.kind = kind
+        self.name = name
+        self.chunks = chunks
+        self.total = len(chunks)
+        self.next_idx = 0
+        self.acked = 0
+        self.acked_bytes = 0
+        self.credit = credit
+        self.elapsed = None
+
+    def can_send(self):
+        return self.next_idx < self.total and (self.credit is None or self.next_idx < self.credit)
+
+    def done(self):
+        return self.acked == self.total
+
+
+def build_chunk_packet(seq, stream_id, index, total, filename, raw_chunk, base, offset,
+                       wire="json", conn_id=0, size=None):
+    """
+    Monta o datagrama de um file_chunk no formato negociado, como lista de
+    buffers para sock.sendmsg (scatter/gather, sem concatenar o payload).
+    - "bin2": cabeçalho WIRE_HEADER + bytes crus (filename/size vão no handshake)
+    - "json": JSON com payload em base64. O campo "base" (primeiro seq da
+      conexão) avisa o servidor que este cliente entende ack_frame; "offset"
+      e "size" permitem gravar o chunk direto na posição final do arquivo.
+      "filename" mantém servidores antigos, sem streams, funcionando.
+    """
+    if wire == "bin2":
+        header = WIRE_HEADER.pack(
+            WIRE_MAGIC, WIRE_VERSION, PKT_FILE_CHUNK,
+            conn_id, stream_id, seq, index, total, offset, len(raw_chunk),
+        )
+        return [header, raw_chunk]
+
+    pkt = {
+        "type": "file_chunk",
+        "seq": seq,
+        "conn_id": conn_id,
+        "stream": stream_id,
+        "index": index,
+        "base": base,
+        "total": total,
+        "offset": offset,
+        "size": size,
+        "filename": filename,
+        "data": base64.b64encode(raw_chunk).decode(),
+    }
+    return [json.dumps(pkt).encode()]
+
+
+def acked_by_frame(resp, in_flight):
+    """Retorna os seqs em voo confirmados por um ack_frame (cum + SACK)."""
+    cum = resp.get("cum", 0)
+    ranges = resp.get("sack", [])
+    return [
+        seq for seq in in_flight
+        if seq < cum or any(lo <= seq <= hi for lo, hi in ranges)
+    ]
+
+
+def stream_acked(info, elapsed):
+    """Contabiliza no stream um chunk confirmado; marca o tempo de conclusão."""
+    stream = info["stream"]
+    stream.acked += 1
+    stream.acked_bytes += info["nbytes"]
+    if stream.done():
+        stream.elapsed = elapsed
+        print(f"[STREAM] {stream.id} ({stream.name}) concluído em {elapsed:.2f}s")
+
+
+def next_sendable(rotation):
+    """Round-robin: o próximo stream com chunk novo e crédito, que vai para o fim da fila."""
+    for _ in range(len(rotation)):
+        stream = rotation[0]
+        rotation.rotate(-1)
+        if stream.can_send():
+            return stream
+    return None
+
+
+def send_streams(
+    streams,
+    server_addr,
+    window_size=WINDOW_SIZE,
+    seq_base=1000,
+    wire="json",
+    conn_id=0,
+    cc=None,
+):
+    """
+    Envia os chunks de todos os streams (SendStream) com janela deslizante
+    única: mantém até window_size chunks sem ACK em voo, guarda o instante de
+    envio de cada seq e retransmite apenas os chunks cujo ACK não chegou
+    dentro do RTO (até MAX_RETRIES). No RTO só o chunk expirado mais antigo
+    sai na hora; os outros voltam para uma fila de retransmissão e saem
+    antes dos chunks novos, conforme a janela (já reduzida) permite.
+    Os streams revezam em round-robin um chunk por vez, então um arquivo
+    grande não atrasa os pequenos; cada stream só envia índices abaixo do
+    crédito recebido do servidor (campo "credit" dos ACKs).
+    O seq é o número de pacote da conexão, atribuído no primeiro envio de
+    cada chunk e mantido nas retransmissões.
+    O RTO vem de rtt_estimator: amostras só de chunks não retransmitidos
+    (Karn), descontando o ack_delay informado pelo servidor.
+    A janela efetiva é min(window_size, cwnd) do controle de congestionamento
+    cc; um chunk com ACK de LOSS_REORDER_THRESHOLD seqs à frente é dado como
+    perdido e retransmitido na hora (fast retransmit), sem esperar o RTO.
+    Os chunks vão no formato de wire negociado no handshake e só são lidos
+    dos arquivos quando entram na janela.
+    Aceita tanto ack_chunk (um seq por ACK) quanto ack_frame (cumulativo +
+    SACK): um chunk coberto por qualquer ACK posterior não é retransmitido,
+    mesmo que o ACK dele próprio tenha se perdido.
+    Retorna (ok, stats) com bytes confirmados, tempo, goodput e RTTs.
+    """
+    by_id = {stream.id: stream for stream in streams}
+    rotation = deque(streams)
+    total = sum(stream.total for stream in streams)
+    next_seq = seq_base
+    acked = 0
+    acked_bytes = 0
+    retransmissions = 0
+    rtts = []
+
+    # seq -> {"stream", "idx", "nbytes", "sent", "attempts", "wire", "fast_rtx"}
+    in_flight = {}
+    # seqs expirados no RTO esperando espaço na janela (não contam como em voo)
+    rtx_queue = set()
+
+    if cc is None:
+        cc = make_congestion_controller(max_window=window_size)
+    largest_acked = seq_base - 1
+    highest_sent = seq_base - 1
+    fast_retransmissions = 0
+
+    start = time.time()
+    ok = True
+
+    while acked < total:
+        # Preenche a janela: primeiro retransmissões adiadas pelo RTO, depois
+        # chunks novos, um stream de cada vez
+        while len(in_flight) - len(rtx_queue) < min(window_size, cc.window()):
+            if rtx_queue:
+                seq = min(rtx_queue)
+                rtx_queue.discard(seq)
+                info = in_flight[seq]
+                info["attempts"] += 1
+                info["sent"] = time.time()
+                retransmissions += 1
+                sock.sendmsg(info["wire"], [], 0, server_addr)
+                print(f"[SEND] seq={seq}, tentativa={info['attempts']}")
+                continue
+            stream = next_sendable(rotation)
+            if stream is None:
+                break
+            idx = stream.next_idx
+            stream.next_idx += 1
+            seq = next_seq
+            next_seq += 1
+            raw_chunk = stream.chunks[idx]
+            buffers = build_chunk_packet(
+                seq, stream.id, idx, stream.total, stream.name, raw_chunk, seq_base,
+                stream.chunks.offset(idx), wire=wire, conn_id=conn_id, size=stream.chunks.size,
+            )
+            sock.sendmsg(buffers, [], 0, server_addr)
+            in_flight[seq] = {
+                "stream": stream,
+                "idx": idx,
+                "nbytes": len(raw_chunk),
+                "sent": time.time(),
+                "attempts": 1,
+                "wire": buffers,
+                "fast_rtx": False,
+            }
+            highest_sent = seq
+            print(f"[SEND] seq={seq}, stream={stream.id}, idx={idx}, tentativa=1")
+
+        if not in_flight:
+            # Tudo confirmado até o crédito e nenhum crédito novo: não há o que esperar
+            print("[FALHA] streams sem crédito do servidor e sem chunks em voo")
+            ok = False
+            break
+
+        # Espera ACK no máximo até o próximo timeout da janela
+        oldest = min((info["sent"] for seq, info in in_flight.items() if seq not in rtx_queue),
+                     default=time.time())
+        sock.settimeout(max(0.001, oldest + rtt_estimator.rto - time.time()))
+
+        newly_acked = []
+        rtt = None
         try:
             data, _ = sock.recvfrom(2048)
             recv_time = time.time()
-            rtt = recv_time - send_time
-
             resp = json.loads(data.decode())
-            if resp.get("type") in ("ack", "ack_chunk") and resp.get("seq") == seq:
+            seq = resp.get("seq")
+
+            if resp.get("type") == "ack_frame":
+                newly_acked = acked_by_frame(resp, in_flight)
+                if seq in newly_acked:
+                    # Amostra de RTT só do chunk que disparou o ACK, sem o
+                    # tempo que o servidor segurou o ACK (ack_delay)
+                    rtt = recv_time - in_flight[seq]["sent"]
+                    rtts.append(rtt)
+                    if in_flight[seq]["attempts"] == 1:
+                        ack_delay = resp.get("ack_delay", 0.0)
+                        rtt_estimator.on_sample(rtt - ack_delay if rtt > ack_delay else rtt)
+                for s in newly_acked:
+                    info = in_flight.pop(s)
+                    rtx_queue.discard(s)
+                    acked += 1
+                    acked_bytes += info["nbytes"]
+                    stream_acked(info, recv_time - start)
+                # Crédito só aumenta (ACKs podem chegar fora de ordem)
+                for stream_id, limit in resp.get("credit", []):
+                    stream = by_id.get(stream_id)
+                    if stream is not None and stream.credit is not None:
+                        stream.credit = max(stream.credit, limit)
+                rtt_str = f"{rtt:.3f}s" if rtt is not None else "n/a"
+                print(f"[ACK OK] cum={resp.get('cum')}, sack={resp.get('sack')}, "
+                      f"credit={resp.get('credit')}, confirmados={len(newly_acked)}, rtt={rtt_str}")
+            elif resp.get("type") in ("ack", "ack_chunk") and seq in in_flight:
+                newly_acked = [seq]
+                info = in_flight.pop(seq)
+                rtx_queue.discard(seq)
+                rtt = recv_time - info["sent"]
+                rtts.append(rtt)
+                if info["attempts"] == 1:
+                    rtt_estimator.on_sample(rtt)
+                acked += 1
+                acked_bytes += info["nbytes"]
+                stream_acked(info, recv_time - start)
                 print(f"[ACK OK] seq={seq}, rtt={rtt:.3f}s, resp={resp}")
-                return True, rtt
             else:
+                # ACK duplicado (retransmissão já confirmada) ou de outro pacote
                 print(f"[ACK INVÁLIDO] resp={resp}")
         except socket.timeout:
-            print(f"[TIMEOUT] seq={seq} (tentativa {attempts})")
+            pass
+        except ValueError:
+            print(f"[ACK INVÁLIDO] raw={data!r}")
 
-    print(f"[FALHA] seq={seq} sem ACK após {MAX_RETRIES} tentativas")
-    return False, None
+        now = time.time()
+        if newly_acked:
+            largest_acked = max(largest_acked, max(newly_acked))
+            rtt_estimator.on_progress()
+            cc.on_ack(len(newly_acked), largest_acked, rtt, now)
 
-def load_file_chunks(filename, chunk_size=1024):
-    """Lê o arquivo em binário e retorna lista de chunks (bytes)."""
-    with open(filename, "rb") as f:
-        data = f.read()
+            # Fast retransmit: buraco com ACKs suficientes acima dele
+            for seq, info in sorted(in_flight.items()):
+                if largest_acked - seq < LOSS_REORDER_THRESHOLD:
+                    break
+                if info["fast_rtx"] or seq in rtx_queue:
+                    continue
+                if cc.on_loss(highest_sent, now):
+                    print(f"[CC] perda detectada por SACK em seq={seq}: {cc}")
+                info["fast_rtx"] = True
+                info["attempts"] += 1
+                info["sent"] = now
+                retransmissions += 1
+                fast_retransmissions += 1
+                sock.sendmsg(info["wire"], [], 0, server_addr)
+                print(f"[SEND] seq={seq}, tentativa={info['attempts']} (fast retransmit)")
 
-    chunks = [
-        data[i:i + chunk_size]
-        for i in range(0, len(data), chunk_size)
-    ]
-    return chunks
+        # Chunks que estouraram o RTO: um único backoff por rodada, mesmo que
+        # vários expirem juntos. Só o mais antigo é retransmitido agora; os
+        # outros vão para a fila e saem conforme a janela reduzida permite
+        rto = rtt_estimator.rto
+        expired = [seq for seq, info in in_flight.items()
+                   if seq not in rtx_queue and now - info["sent"] >= rto]
+        if expired:
+            rtt_estimator.on_timeout()
+            cc.on_timeout(now)
+            print(f"[CC] timeout: {cc}")
+        for seq in expired:
+            info = in_flight[seq]
+            print(f"[TIMEOUT] seq={seq} (tentativa {info['attempts']}) [RTT] {rtt_estimator}")
+            if info["attempts"] >= MAX_RETRIES:
+                print(f"[FALHA] seq={seq} sem ACK após {MAX_RETRIES} tentativas")
+                ok = False
+                break
+            if seq != expired[0]:
+                rtx_queue.add(seq)
+                continue
+            info["attempts"] += 1
+            info["sent"] = now
+            retransmissions += 1
+            sock.sendmsg(info["wire"], [], 0, server_addr)
+            print(f"[SEND] seq={seq}, tentativa={info['attempts']}")
+
+        if not ok:
+            break
+
+    sock.settimeout(TIMEOUT)
+
+    elapsed = max(time.time() - start, 1e-9)
+    stats = {
+        "acked": acked,
+        "total": total,
+        "bytes": acked_bytes,
+        "elapsed": elapsed,
+        "goodput": acked_bytes / elapsed,
+        "retransmissions": retransmissions,
+        "fast_retransmissions": fast_retransmissions,
+        "cc": str(cc),
+        "streams": [
+            {"id": s.id, "name": s.name, "acked": s.acked, "total": s.total,
+             "bytes": s.acked_bytes, "elapsed": s.elapsed}
+            for s in streams
+        ],
+        "rtt_avg": (sum(rtts) / len(rtts)) if rtts else None,
+        "rtt_estimator": rtt_estimator.state(),
+    }
+    return ok, stats
+
+
+def send_session(specs, files, messages, server_addr, seq_base, wire, conn_id, credit, multistream):
+    """
+    Envia arquivos (e, com multistream, o stream de mensagens) numa conexão
+    já aberta pelo handshake e imprime as estatísticas. Retorna (ok, stats).
+    """
+    chunk_size = BIN_CHUNK_SIZE if wire == "bin2" else CHUNK_SIZE
+    with contextlib.ExitStack() as stack:
+        streams = []
+        for spec, path in zip(specs, files):
+            chunks = stack.enter_context(FileChunks(path, chunk_size))
+            streams.append(SendStream(spec["id"], "file", spec["filename"], chunks,
+                                      credit.get(spec["id"]) if multistream else None))
+        if messages and multistream:
+            stream_id = specs[-1]["id"]
+            chunks = stack.enter_context(MessageChunks(messages))
+            streams.append(SendStream(stream_id, "msg", "mensagens", chunks, credit.get(stream_id)))
+
+        for stream in streams:
+            print(f"[CLIENTE] Stream {stream.id}: {stream.name} em {stream.total} chunks "
+                  f"de até {chunk_size} bytes")
+        print(f"[CLIENTE] Enviando {len(streams)} streams (janela máx.={WINDOW_SIZE}, "
+              f"cc={CC_ALGORITHM}).")
+
+        ok, stats = send_streams(
+            streams,
+            server_addr,
+            window_size=WINDOW_SIZE,
+            seq_base=seq_base,
+            wire=wire,
+            conn_id=conn_id,
+            cc=make_congestion_controller(CC_ALGORITHM, WINDOW_SIZE),
+        )
+    if not ok:
+        print("[CLIENTE] Falha ao enviar chunks. Encerrando transmissão dos streams.")
+
+    rtt_avg = f"{stats['rtt_avg']:.3f}s" if stats["rtt_avg"] is not None else "n/a"
+    for st in stats["streams"]:
+        elapsed = f"{st['elapsed']:.2f}s" if st["elapsed"] is not None else "incompleto"
+        print(f"[CLIENTE] [STREAM {st['id']}] {st['name']}: {st['acked']}/{st['total']} chunks, "
+              f"{st['bytes']} bytes, {elapsed}")
+    print(f"[CLIENTE] Goodput: {stats['goodput'] / 1024:.1f} KB/s "
+          f"({stats['bytes']} bytes em {stats['elapsed']:.2f}s, "
+          f"{stats['acked']}/{stats['total']} chunks, "
+          f"retransmissões={stats['retransmissions']}, rtt_médio={rtt_avg})")
+    print(f"[CLIENTE] [RTT] {rtt_estimator}")
+    print(f"[CLIENTE] [CC] {stats['cc']}, fast_retransmits={stats['fast_retransmissions']}")
+
+    return ok, stats
 
 
 def main():
     server_addr = (SERVER_IP, SERVER_PORT)
 
-    # Handshake
+    seq_base = 1000  # só para separar da sequência dos outros pacotes
+    conn_id = random.getrandbits(32)
+
+    files = []
+    for path in FILES_TO_SEND:
+        if os.path.exists(path):
+            files.append(path)
+        else:
+            print(f"[CLIENTE] Arquivo {path} não encontrado, pulando envio desse arquivo.")
+
+    # Um stream por arquivo e, por último, o stream das mensagens de dados
+    specs = [
+        {"id": i, "kind": "file", "filename": os.path.basename(path), "size": os.path.getsize(path)}
+        for i, path in enumerate(files, start=1)
+    ]
+    messages = [f"pacote_data_{i}" for i in range(1, NUM_DATA_PKTS + 1)]
+    if messages:
+        specs.append({"id": len(files) + 1, "kind": "msg"})
+
+    # Handshake (oferece o formato binário e declara os streams; servidores
+    # antigos ignoram os campos extras e respondem sem "wire"/"credit")
     seq = 0
     handshake = {
         "type": "handshake",
         "seq": seq,
-        "msg": "hello-quic-sim"
+        "msg": "hello-quic-sim",
+        "conn_id": conn_id,
+        "wire": WIRE_FORMATS,
+        "base": seq_base,
+        "streams": specs,
     }
 
     print("[CLIENTE] Enviando handshake...")
-    ok, rtt = send_and_wait_ack(handshake, server_addr)
+    ok, rtt, resp = send_and_wait_ack(handshake, server_addr)
     if not ok:
         print("[CLIENTE] Handshake falhou, encerrando.")
         return
 
-    
-    # --- ENVIO DE ARQUIVO (NOVO) ---
-    if not os.path.exists(FILE_TO_SEND):
-        print(f"[CLIENTE] Arquivo {FILE_TO_SEND} não encontrado, pulando envio de arquivo.")
-        return
-
-    chunks = load_file_chunks(FILE_TO_SEND, CHUNK_SIZE)
-    total = len(chunks)
-    print(f"[CLIENTE] Enviando arquivo {FILE_TO_SEND} em {total} chunks de até {CHUNK_SIZE} bytes.")
+    # Sem "credit" o servidor não conhece streams: os arquivos vão em JSON
+    # (identificados pelo nome) e as mensagens no modo antigo, uma a uma
+    multistream = "credit" in resp
+    credit = dict(resp.get("credit", []))
+    wire = resp.get("wire", "json")
+    if wire not in WIRE_FORMATS or not multistream:
+        wire = "json"
+    print(f"[CLIENTE] Formato negociado: {wire}, streams={'sim' if multistream else 'não'}")
 
-    seq_base = 1000  # só para separar da sequência dos outros pacotes
-
-    for i, raw_chunk in enumerate(chunks):
-        seq = seq_base + i
-        b64_chunk = base64.b64encode(raw_chunk).decode()
+    if multistream:
+        send_session(specs, files, messages, server_addr, seq_base, wire, conn_id, credit, True)
+    else:
+        # Servidor sem streams não separa chunks de arquivos intercalados:
+        # um arquivo por conexão, um de cada vez, cada um com seu handshake
+        base = seq_base
+        for i, (spec, path) in enumerate(zip(specs, files)):
+            if i > 0:
+                conn_id = random.getrandbits(32)
+                handshake.update(conn_id=conn_id, base=base, streams=[spec])
+                print("[CLIENTE] Enviando handshake...")
+                ok, rtt, resp = send_and_wait_ack(handshake, server_addr)
+                if not ok:
+                    print("[CLIENTE] Handshake falhou, encerrando.")
+                    break
+            ok, stats = send_session([spec], [path], [], server_addr, base, wire, conn_id, {}, False)
+            if not ok:
+                break
+            base += stats["total"]
 
-        pkt = {
-            "type": "file_chunk",
-            "seq": seq,
-            "total": total,
-            "filename": os.path.basename(FILE_TO_SEND),
-            "data": b64_chunk,
-        }
+    print("[CLIENTE] Fim da transmissão dos streams.")
 
-        ok, rtt = send_and_wait_ack(pkt, server_addr)
-        if not ok:
-            print(f"[CLIENTE] Falha ao enviar chunk seq={seq}. Encerrando transmissão de arquivo.")
-            break
-
-    print("[CLIENTE] Fim da transmissão do arquivo.")
-
-
-    # Envio de pacotes de dados
-    for i in range(1, NUM_DATA_PKTS + 1):
-        pkt = {
-            "type": "data",
-            "seq": i,
-            "msg": f"pacote_data_{i}"
-        }
-        ok, rtt = send_and_wait_ack(pkt, server_addr)
-        time.sleep(0.5)
+    if not multistream:
+        # Servidor antigo: pacotes de dados um a um (stop-and-wait)
+        for i in range(1, NUM_DATA_PKTS + 1):
+            pkt = {
+                "type": "data",
+                "seq": i,
+                "conn_id": conn_id,
+                "msg": f"pacote_data_{i}"
+            }
+            ok, rtt, resp = send_and_wait_ack(pkt, server_addr)
+            time.sleep(0.5)
 
     print("[CLIENTE] Fim da simulação QUIC-sim.")
 
@@ -2,17 +2,28 @@
 #
 # Servidor "QUIC-sim" baseado em UDP:
 # - Porta 4433 (porta típica para testes QUIC)
-# - Simula atraso de rede
-# - Simula perda de pacotes
+# - Simula atraso de rede (uniforme, fixo ou normal com jitter), sem bloquear
+#   a recepção: cada pacote é processado por um timer do asyncio
+# - Simula perda de pacotes (Bernoulli ou Gilbert-Elliott em rajadas)
 # - Responde com ACK contendo o seq
-
+# - Para file_chunk: ACK cumulativo + faixas SACK, com ACK atrasado/agrupado
+# - Aceita chunks em formato binário ("bin2", negociado no handshake) ou JSON
+# - Vários streams (arquivos e mensagens) por conexão, declarados no handshake,
+#   com ACK por número de pacote da conexão e crédito de fluxo por stream
+# - Vários clientes ao mesmo tempo: estado por (endereço, conn_id), com
+#   expiração por inatividade e limite de memória por conexão
+# - Grava cada chunk direto no offset do arquivo de saída (pwrite), sem
+#   acumular o arquivo em memória; só um bitmap de chunks recebidos
+
+import asyncio
 import base64
-from collections import defaultdict
+import hashlib
+import os
 
 
-import socket
 import json
 import random
+import struct
 import time
 
 HOST = "0.0.0.0"
@@ -24,15 +35,113 @@ LOSS_PROB = 0.3
 # Atraso máximo artificial na resposta (em segundos)
 MAX_DELAY = 0.5
 
-sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-sock.bind((HOST, PORT))
-
-print(f"[SERVIDOR] QUIC-sim escutando em {HOST}:{PORT}")
-print(f"[SERVIDOR] LOSS_PROB={LOSS_PROB}, MAX_DELAY={MAX_DELAY}s")
-
-
-def rebuild_file(filename, file_info):
-    """Reconstrói o arquivo a partir dos chunks recebidos."""
+# Modelo de atraso:
+#   "uniform": uniforme em [0, MAX_DELAY]
+#   "fixed":   sempre FIXED_DELAY
+#   "normal":  normal(DELAY_MEAN, DELAY_JITTER), truncada em [0, MAX_DELAY]
+DELAY_MODEL = "uniform"
+FIXED_DELAY = 0.1
+DELAY_MEAN = 0.1
+DELAY_JITTER = 0.03
+
+# Modelo de perda:
+#   "bernoulli": cada pacote perdido com LOSS_PROB, independente dos outros
+#   "gilbert":   Gilbert-Elliott; estado "bom"/"ruim" com perdas em rajada
+LOSS_MODEL = "bernoulli"
+GE_P_GOOD_TO_BAD = 0.05   # prob. de ir do estado bom para o ruim (por pacote)
+GE_P_BAD_TO_GOOD = 0.3    # prob. de voltar do ruim para o bom
+GE_LOSS_GOOD = 0.01       # perda no estado bom
+GE_LOSS_BAD = 0.8         # perda no estado ruim
+
+# ACKs de file_chunk (clientes que enviam "base" recebem ack_frame):
+# envia um ACK a cada ACK_EVERY chunks ou, no máximo, ACK_DELAY segundos
+# depois do primeiro chunk ainda não confirmado.
+ACK_EVERY = 4
+ACK_DELAY = 0.025
+MAX_SACK_RANGES = 32   # limita o tamanho do ack_frame
+
+# Conexões: estado descartado após IDLE_TIMEOUT segundos sem pacotes
+# (transferências abandonadas) e no máximo CONN_MEM_BUDGET bytes de estado
+# por conexão (bitmaps de recepção e, para clientes antigos sem offset,
+# os chunks guardados). Chunks acima do limite são descartados sem ACK.
+IDLE_TIMEOUT = 60.0
+IDLE_CHECK_INTERVAL = 5.0
+CONN_MEM_BUDGET = 64 * 1024 * 1024
+
+# Tamanho máximo de um arquivo recebido: o tamanho declarado no handshake é
+# pré-alocado no disco, então handshakes acima disso são recusados, e chunks
+# cujo offset + tamanho passe do tamanho declarado (ou deste limite, se não
+# declarado) são descartados sem ACK.
+MAX_FILE_SIZE = 1024 * 1024 * 1024
+
+# Disco reservado por todas as conexões juntas para arquivos ainda em
+# recepção: cada stream de arquivo reserva o tamanho declarado (ou
+# MAX_FILE_SIZE, se não declarado) até terminar ou a conexão cair. Streams
+# que passariam de DISK_BUDGET não são abertos e seus chunks são
+# descartados sem ACK.
+DISK_BUDGET = 4 * 1024 * 1024 * 1024
+
+# Streams: cada conexão declara no handshake até MAX_STREAMS streams
+# ("file" ou "msg"). O servidor libera a um stream só os chunks com índice
+# abaixo de (chunks contíguos recebidos + STREAM_WINDOW); o limite vai em
+# "credit" no ACK do handshake e nos ack_frame. Chunks além dele são
+# descartados sem ACK.
+MAX_STREAMS = 256
+STREAM_WINDOW = 64
+
+# Formato binário dos chunks, mesmo layout do cliente, seguido do payload cru:
+#   "bin2": magic(1) versão(1) tipo(1) conn_id(4) stream(2) seq(4) índice(4) total(4) offset(8) tamanho(2)
+# Datagramas que começam com "{" continuam JSON.
+WIRE_FORMATS = ["bin2", "json"]   # formatos suportados, em ordem de preferência
+WIRE_MAGIC = 0x51
+WIRE_HEADER_V2 = struct.Struct("!BBBIHIIIQH")
+PKT_FILE_CHUNK = 1
+
+
+class GilbertElliott:
+    """Perda em rajadas: cadeia de Markov de dois estados (bom/ruim)."""
+
+    def __init__(self, p_good_to_bad, p_bad_to_good, loss_good, loss_bad):
+        self.p_good_to_bad = p_good_to_bad
+        self.p_bad_to_good = p_bad_to_good
+        self.loss_good = loss_good
+        self.loss_bad = loss_bad
+        self.bad = False
+
+    def lose(self):
+        """Avança o estado e decide se o pacote atual é perdido."""
+        if self.bad:
+            if random.random() < self.p_bad_to_good:
+                self.bad = False
+        elif random.random() < self.p_good_to_bad:
+            self.bad = True
+        return random.random() < (self.loss_bad if self.bad else self.loss_good)
+
+
+def sample_delay():
+    """Sorteia o atraso artificial de um pacote conforme DELAY_MODEL."""
+    if DELAY_MODEL == "fixed":
+        return FIXED_DELAY
+    if DELAY_MODEL == "normal":
+        return min(MAX_DELAY, max(0.0, random.gauss(DELAY_MEAN, DELAY_JITTER)))
+    return random.uniform(0, MAX_DELAY)
+
+
+gilbert = GilbertElliott(GE_P_GOOD_TO_BAD, GE_P_BAD_TO_GOOD, GE_LOSS_GOOD, GE_LOSS_BAD)
+
+
+def should_drop():
+    """Decide se o pacote recebido é "perdido" conforme LOSS_MODEL."""
+    if LOSS_MODEL == "gilbert":
+        return gilbert.lose()
+    return random.random() < LOSS_PROB
+
+
+def rebuild_file(output_name, file_info):
+    """
+    Reconstrói o arquivo a partir dos chunks guardados em memória.
+    Só usado por clientes antigos, que não informam offset/base.
+    """
     chunks_dict = file_info["chunks"]
     total = file_info["total"]
 
@@ -41,80 +150,601 @@ def rebuild_file(filename, file_info):
     if len(ordered_seqs) != total:
         print(f"[SERVIDOR] Aviso: número de chunks ({len(ordered_seqs)}) diferente de total ({total})")
 
-    output_name = f"recebido_{filename}"
     with open(output_name, "wb") as f:
         for seq in ordered_seqs:
             f.write(chunks_dict[seq])
 
     print(f"[SERVIDOR] Arquivo reconstruído como {output_name}")
 
-# Armazena chunks por arquivo: filename -> { "total": int, "chunks": {seq: bytes} }
-files_state = defaultdict(lambda: {"total": None, "chunks": {}})
 
-while True:
-    data, addr = sock.recvfrom(2048)
-    now = time.time()
+def open_output(path, size):
+    """Cria o arquivo de saída já com o tamanho final (pré-alocado)."""
+    fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+    if size:
+        try:
+            os.posix_fallocate(fd, 0, size)
+        except (AttributeError, OSError):
+            os.ftruncate(fd, size)
+    return fd
+
+
+def finish_output(fd, tmp_name, output_name, size):
+    """
+    Fecha o arquivo completo: ajusta o tamanho, grava em disco, renomeia
+    e calcula o MD5 para conferência. Roda fora do loop (executor).
+    """
+    os.ftruncate(fd, size)
+    os.fsync(fd)
+    os.close(fd)
+    os.replace(tmp_name, output_name)
+
+    md5 = hashlib.md5()
+    with open(output_name, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            md5.update(block)
+    return md5.hexdigest()
+
+
+def bit_is_set(bitmap, i):
+    return bitmap[i >> 3] & (1 << (i & 7))
+
+
+def set_bit(bitmap, i):
+    bitmap[i >> 3] |= 1 << (i & 7)
+
+
+def ack_ranges(conn):
+    """
+    Calcula o ACK cumulativo e as faixas SACK dos números de pacote da conexão.
+    cum = próximo seq esperado (todos os seqs < cum já chegaram);
+    sack = lista de faixas [ini, fim] (inclusivas) recebidas acima de cum.
+    """
+    above = conn.above
+    cum = conn.cum
+    while cum in above:
+        above.remove(cum)
+        cum += 1
+    conn.cum = cum
+
+    sack = []
+    for s in sorted(above):
+        if sack and s == sack[-1][1] + 1:
+            sack[-1][1] = s
+        elif len(sack) < MAX_SACK_RANGES:
+            sack.append([s, s])
+        else:
+            break
+    return cum, sack
+
+
+def advance_cum_index(stream):
+    """Avança o índice contíguo do stream (base do crédito de fluxo)."""
+    idx = stream["cum_index"]
+    while idx < stream["total"] and bit_is_set(stream["bitmap"], idx):
+        idx += 1
+    stream["cum_index"] = idx
+
+
+def negotiate_wire(packet):
+    """Escolhe o primeiro formato oferecido pelo cliente que o servidor suporta."""
+    for wire in packet.get("wire", []):
+        if wire in WIRE_FORMATS:
+            return wire
+    return "json"
+
+
+def decode_datagram(data):
+    """
+    Decodifica um datagrama (binário "bin2" ou JSON) em um dict de pacote.
+    Para file_chunk, o payload já decodificado fica em packet["payload"].
+    """
+    if data and data[0] == WIRE_MAGIC:
+        header = WIRE_HEADER_V2
+        if len(data) < header.size:
+            return {"type": "unknown", "raw": f"<bin curto: {len(data)} bytes>"}
+
+        (magic, version, ptype, conn_id, stream, seq,
+         index, total, offset, length) = header.unpack_from(data)
+        if version != 2 or ptype != PKT_FILE_CHUNK:
+            return {"type": "unknown", "raw": f"<bin v{version} tipo={ptype}>"}
+
+        return {
+            "type": "file_chunk",
+            "seq": seq,
+            "stream": stream,
+            "index": index,
+            "total": total,
+            "offset": offset,
+            "conn_id": conn_id,
+            "binary": True,
+            "payload": data[header.size:header.size + length],
+        }
+
     try:
         packet = json.loads(data.decode())
     except Exception:
-        packet = {"type": "unknown", "raw": data.decode(errors="ignore")}
-
-    ptype = packet.get("type", "unknown")
-    seq = packet.get("seq", "?")
-    msg = packet.get("msg", "")
-
-    print(f"[RECV {now:.3f}] de {addr} -> type={ptype}, seq={seq}, msg={msg}")
+        return {"type": "unknown", "raw": data.decode(errors="ignore")}
+
+    if packet.get("type") == "file_chunk":
+        packet["payload"] = base64.b64decode(packet["data"])
+    return packet
+
+
+class Connection:
+    """
+    Estado de um cliente, criado no handshake e identificado por
+    (endereço, conn_id). Clientes antigos, sem handshake negociado, usam
+    conn_id 0. Cada conexão tem seus próprios streams, ACKs pendentes e
+    orçamento de memória, então nomes de arquivo iguais não colidem.
+    Os ACKs são por número de pacote (seq) da conexão, comum a todos os
+    streams; cada chunk diz a qual stream e índice pertence.
+    """
+
+    def __init__(self, addr, conn_id, wire="json", base=None):
+        self.addr = addr
+        self.conn_id = conn_id
+        self.wire = wire
+        self.last_seen = time.time()
+
+        # stream id -> {"kind", "filename", "size"}, declarados no handshake
+        self.stream_specs = {}
+        # stream id (ou filename, para clientes sem streams) -> estado:
+        #   gravação direta: {"kind", "name", "total", "bitmap", "received",
+        #                     "cum_index", "flow", "end", "fd", "tmp", "output", "done"}
+        #   mensagens:       {"kind": "msg", "name", "total", "bitmap", "received",
+        #                     "cum_index", "flow", "done"}
+        #   cliente antigo:  {"kind", "name", "total", "chunks": {seq: bytes}, "output", "done"}
+        self.streams = {}
+
+        # ACK da conexão: todos os seqs < cum chegaram; above = seqs recebidos acima
+        self.cum = base
+        self.largest = base - 1 if base is not None else None
+        self.above = set()
+        # {"seq", "arrived", "count", "timer"} do ack_frame ainda não enviado;
+        # arrived = chegada do chunk seq, base do ack_delay
+        self.pending_ack = None
+        self.mem_used = 0
+
+    def credit(self, stream_id):
+        """Limite (exclusivo) de índice que o stream pode enviar."""
+        stream = self.streams.get(stream_id)
+        return (stream["cum_index"] if stream else 0) + STREAM_WINDOW
+
+    def credits(self):
+        """Créditos dos streams com controle de fluxo ainda abertos, para os ACKs."""
+        return [
+            [sid, self.credit(sid)] for sid in self.stream_specs
+            if not self.streams.get(sid, {}).get("done")
+        ]
+
+
+class QuicSimServerProtocol(asyncio.DatagramProtocol):
+    """Servidor QUIC-sim: um único socket UDP, muitas conexões concorrentes."""
+
+    def __init__(self):
+        self.transport = None
+        self.loop = None
+        # (addr, conn_id) -> Connection
+        self.connections = {}
+        # nomes de saída em uso, para duas conexões não gravarem o mesmo arquivo
+        self.outputs_in_use = set()
+        # bytes reservados no disco pelos arquivos .part abertos
+        self.disk_reserved = 0
+
+    # -----------------------------
+    # asyncio
+    # -----------------------------
+    def connection_made(self, transport):
+        self.transport = transport
+        self.loop = asyncio.get_running_loop()
+
+    def datagram_received(self, data, addr):
+        now = time.time()
+        packet = decode_datagram(data)
+
+        ptype = packet.get("type", "unknown")
+        seq = packet.get("seq", "?")
+        msg = packet.get("msg", "")
+
+        print(f"[RECV {now:.3f}] de {addr} -> type={ptype}, seq={seq}, msg={msg}")
+
+        # Decisão de "perder" o pacote
+        if should_drop():
+            print(f"  -> [DROP] simulando perda do pacote seq={seq}")
+            return
+
+        # Atraso artificial: agenda o processamento sem bloquear a recepção
+        delay = sample_delay()
+        self.loop.call_later(delay, self.handle_packet, packet, addr, delay)
+
+    def send(self, obj, addr):
+        self.transport.sendto(json.dumps(obj).encode(), addr)
+
+    # -----------------------------
+    # Conexões
+    # -----------------------------
+    def get_connection(self, packet, addr):
+        """Conexão do pacote; cria uma implícita (conn_id 0) para clientes antigos."""
+        conn_id = packet.get("conn_id", 0)
+        conn = self.connections.get((addr, conn_id))
+        if conn is None and not packet.get("binary"):
+            conn = Connection(addr, conn_id)
+            self.connections[(addr, conn_id)] = conn
+        if conn is not None:
+            conn.last_seen = time.time()
+        return conn
+
+    def close_connection(self, conn, reason):
+        if conn.pending_ack is not None:
+            conn.pending_ack["timer"].cancel()
+        for stream in conn.streams.values():
+            self.outputs_in_use.discard(stream.get("output"))
+            # Transferência abandonada: descarta o arquivo parcial
+            if stream.get("fd") is not None and not stream["done"]:
+                os.close(stream["fd"])
+                os.unlink(stream["tmp"])
+                self.disk_reserved -= stream["limit"]
+        self.connections.pop((conn.addr, conn.conn_id), None)
+        print(f"[SERVIDOR] Conexão {conn.addr} conn_id={conn.conn_id} encerrada ({reason}); "
+              f"{len(self.connections)} ativas")
+
+    async def evict_idle(self):
+        """Descarta periodicamente conexões sem tráfego há IDLE_TIMEOUT segundos."""
+        while True:
+            await asyncio.sleep(IDLE_CHECK_INTERVAL)
+            now = time.time()
+            for conn in list(self.connections.values()):
+                if now - conn.last_seen > IDLE_TIMEOUT:
+                    self.close_connection(conn, "inativa")
+
+    def output_name(self, conn, filename):
+        """recebido_<arquivo>, ou com o conn_id se outra conexão já usa esse nome."""
+        name = f"recebido_{filename}"
+        if name in self.outputs_in_use:
+            name = f"recebido_{conn.conn_id:08x}_{filename}"
+        self.outputs_in_use.add(name)
+        return name
+
+    # -----------------------------
+    # ACKs agrupados
+    # -----------------------------
+    def send_ack_frame(self, conn):
+        """Envia o ack_frame pendente da conexão (todos os streams) e limpa a pendência."""
+        pending = conn.pending_ack
+        if pending is None:
+            return
+        conn.pending_ack = None
+        pending["timer"].cancel()
+
+        cum, sack = ack_ranges(conn)
+        ack = {
+            "type": "ack_frame",
+            "seq": pending["seq"],
+            "cum": cum,
+            "sack": sack,
+            "ack_delay": round(time.time() - pending["arrived"], 6),
+        }
+        credit = conn.credits()
+        if credit:
+            ack["credit"] = credit
+        self.send(ack, conn.addr)
+        print(f"  -> [SEND] ACK_FRAME cum={cum} sack={sack} credit={credit} "
+              f"({pending['count']} chunks) para {conn.addr}")
+
+    # -----------------------------
+    # Pacotes
+    # -----------------------------
+    def handle_packet(self, packet, addr, delay):
+        """Processa um pacote depois do atraso artificial (ACKs, chunks, handshake)."""
+        ptype = packet.get("type", "unknown")
+        seq = packet.get("seq", "?")
+
+        if ptype == "handshake":
+            self.handle_handshake(packet, addr, delay)
+            return
+
+        conn = self.get_connection(packet, addr)
+
+        # --- NOVO: tratamento de file_chunk ---
+        if ptype == "file_chunk":
+            if conn is None:
+                print(f"  -> [IGNORADO] chunk seq={seq} de conexão desconhecida "
+                      f"(conn_id={packet.get('conn_id')})")
+                return
+            self.handle_file_chunk(conn, packet)
+            return
+
+        response = {
+            "type": "ack",
+            "seq": seq,
+            "info": f"ack-from-server (delay={delay:.3f}s)"
+        }
+        self.send(response, addr)
 
-    # Decisão de "perder" o pacote
-    if random.random() < LOSS_PROB:
-        print(f"  -> [DROP] simulando perda do pacote seq={seq}")
-        continue
+        print(f"  -> [SEND] ACK seq={seq} para {addr} (delay={delay:.3f}s)")
 
-    # Atraso artificial
-    delay = random.uniform(0, MAX_DELAY)
-    time.sleep(delay)
+    def handle_handshake(self, packet, addr, delay):
+        """Cria (ou renova) a conexão e responde com o formato de wire escolhido."""
+        seq = packet.get("seq", "?")
+        conn_id = packet.get("conn_id", 0)
 
+        response = {
+            "type": "ack",
+            "seq": seq,
+            "info": f"ack-from-server (delay={delay:.3f}s)"
+        }
 
-    # --- NOVO: tratamento de file_chunk ---
-    if ptype == "file_chunk":
-        filename = packet.get("filename", "arquivo.bin")
+        conn = self.connections.get((addr, conn_id))
+        if conn is None:
+            conn = Connection(addr, conn_id)
+            self.connections[(addr, conn_id)] = conn
+        conn.last_seen = time.time()
+
+        # Clientes antigos não enviam "wire" e seguem em JSON
+        if "wire" in packet:
+            conn.wire = negotiate_wire(packet)
+            base = packet.get("base")
+            if conn.cum is None and base is not None:
+                conn.cum = base
+                conn.largest = base - 1
+            response["wire"] = conn.wire
+
+        # Clientes com streams declaram todos no handshake e recebem o crédito inicial
+        if "streams" in packet:
+            for spec in packet["streams"][:MAX_STREAMS]:
+                kind = spec.get("kind", "file")
+                if kind not in ("file", "msg"):
+                    continue
+                conn.stream_specs.setdefault(spec["id"], {
+                    "kind": kind,
+                    "filename": os.path.basename(spec.get("filename") or f"stream_{spec['id']}.bin"),
+                    "size": spec.get("size"),
+                })
+            response["credit"] = conn.credits()
+
+        if "wire" in packet:
+            print(f"  -> [HANDSHAKE] conn_id={conn_id} wire={conn.wire} "
+                  f"streams={len(conn.stream_specs)} ({len(self.connections)} conexões ativas)")
+
+        self.send(response, addr)
+        print(f"  -> [SEND] ACK seq={seq} para {addr} (delay={delay:.3f}s)")
+
+    def open_stream(self, conn, key, spec, total, indexed, flow):
+        """
+        Cria o estado de recepção de um stream. Arquivos com índice/offset
+        conhecidos são pré-alocados no disco e guardam só um bitmap de
+        chunks; mensagens guardam só o bitmap; sem índice (cliente antigo),
+        os chunks ficam em memória até o fim.
+        Retorna None se o estado não cabe no orçamento da conexão.
+        """
+        kind = spec["kind"]
+        filename = spec["filename"]
+
+        if kind == "file" and not indexed:
+            output = self.output_name(conn, filename)
+            stream = {"kind": kind, "name": filename, "total": total, "chunks": {},
+                      "output": output, "done": False}
+            conn.streams[key] = stream
+            return stream
+
+        bitmap_size = (total + 7) // 8
+        if conn.mem_used + bitmap_size > CONN_MEM_BUDGET:
+            return None
+        conn.mem_used += bitmap_size
+
+        stream = {
+            "kind": kind,
+            "name": filename if kind == "file" else f"mensagens#{key}",
+            "total": total,
+            "bitmap": bytearray(bitmap_size),
+            "received": 0,
+            "cum_index": 0,
+            "flow": flow,
+            "done": False,
+        }
+        if kind == "file":
+            output = self.output_name(conn, filename)
+            tmp = output + ".part"
+            limit = spec.get("size") if spec.get("size") is not None else MAX_FILE_SIZE
+            self.disk_reserved += limit
+            stream.update({
+                "end": 0,
+                "fd": open_output(tmp, spec.get("size")),
+                "limit": limit,
+                "tmp": tmp,
+                "output": output,
+            })
+        conn.streams[key] = stream
+        return stream
+
+    def handle_file_chunk(self, conn, packet):
+        addr = conn.addr
+        seq = packet["seq"]
         total = packet["total"]
-        b64_data = packet["data"]
-
-        chunk_bytes = base64.b64decode(b64_data)
-
-        file_info = files_state[filename]
-
-        # define total na primeira vez
-        if file_info["total"] is None:
-            file_info["total"] = total
-
-        file_info["chunks"][seq] = chunk_bytes
-
-        print(f"[SERVIDOR] Recebido chunk seq={seq} do arquivo {filename} "
-              f"({len(file_info['chunks'])}/{file_info['total']})")
+        chunk_bytes = packet["payload"]
+        offset = packet.get("offset")
+        stream_id = packet.get("stream")
+
+        if stream_id is not None:
+            spec = conn.stream_specs.get(stream_id)
+            if spec is None:
+                print(f"  -> [IGNORADO] chunk seq={seq} de stream não declarado ({stream_id})")
+                return
+            key = stream_id
+            index = packet.get("index")
+        else:
+            # Sem streams: um arquivo por nome, índice = seq - base
+            filename = os.path.basename(packet.get("filename") or "arquivo.bin")
+            base = packet.get("base")
+            size = packet.get("size")
+            if offset is None:
+                base = None
+            if base is not None and conn.cum is None:
+                conn.cum = base
+                conn.largest = base - 1
+            spec = {"kind": "file", "filename": filename, "size": size}
+            key = filename
+            index = seq - base if base is not None else None
+
+        stream = conn.streams.get(key)
+        if stream is None:
+            size = spec.get("size")
+            if spec["kind"] == "file" and size is not None and (
+                    not isinstance(size, int) or not 0 <= size <= MAX_FILE_SIZE):
+                print(f"  -> [LIMITE] arquivo {spec['filename']} declara {size} bytes "
+                      f"(máximo {MAX_FILE_SIZE}); descartando chunk seq={seq}")
+                return
+            if spec["kind"] == "file" and index is not None and \
+                    self.disk_reserved + (size if size is not None else MAX_FILE_SIZE) > DISK_BUDGET:
+                print(f"  -> [DISCO] arquivo {spec['filename']} passaria de {DISK_BUDGET} bytes "
+                      f"reservados ({self.disk_reserved} em uso); descartando chunk seq={seq}")
+                return
+            stream = self.open_stream(conn, key, spec, total, index is not None, stream_id is not None)
+            if stream is None:
+                print(f"  -> [BUDGET] conexão {addr} conn_id={conn.conn_id} acima de "
+                      f"{CONN_MEM_BUDGET} bytes; descartando chunk seq={seq}")
+                return
+
+        if "chunks" in stream:
+            self.handle_legacy_chunk(conn, stream, seq, chunk_bytes)
+            return
+
+        if not 0 <= index < stream["total"]:
+            print(f"  -> [IGNORADO] chunk seq={seq} fora do stream {stream['name']}")
+            return
+        if stream["flow"] and index >= stream["cum_index"] + STREAM_WINDOW:
+            print(f"  -> [FLOW] chunk seq={seq} índice={index} acima do crédito do "
+                  f"stream {key} ({stream['cum_index'] + STREAM_WINDOW})")
+            return
+
+        if stream["kind"] == "file" and (
+                offset is None or offset < 0 or offset + len(chunk_bytes) > stream["limit"]):
+            print(f"  -> [IGNORADO] chunk seq={seq} com offset {offset} fora do arquivo "
+                  f"{stream['name']} ({stream['limit']} bytes)")
+            return
+
+        duplicate = bool(bit_is_set(stream["bitmap"], index))
+        if not duplicate:
+            if stream["kind"] == "file":
+                # Grava direto no offset: nada do arquivo fica em memória
+                os.pwrite(stream["fd"], chunk_bytes, offset)
+                stream["end"] = max(stream["end"], offset + len(chunk_bytes))
+            else:
+                text = bytes(chunk_bytes).decode(errors="replace")
+                print(f"[SERVIDOR] Mensagem stream={key} #{index}: {text}")
+            set_bit(stream["bitmap"], index)
+            stream["received"] += 1
+            advance_cum_index(stream)
+        received = stream["received"]
+
+        print(f"[SERVIDOR] Recebido chunk seq={seq} do stream {stream['name']} "
+              f"({received}/{stream['total']})")
+
+        complete = received == stream["total"]
+
+        # ACK cumulativo + SACK dos números de pacote da conexão, agrupado.
+        # Como no QUIC: "em ordem" é o seq logo após o maior recebido;
+        # abrir um buraco novo ou preencher um antigo pede ACK imediato.
+        if conn.cum is None:
+            conn.cum = seq
+            conn.largest = seq - 1
+        in_order = (seq == conn.largest + 1)
+        conn.largest = max(conn.largest, seq)
+        if seq >= conn.cum:
+            conn.above.add(seq)
+        else:
+            duplicate = True
+
+        pending = conn.pending_ack
+        if pending is None:
+            pending = {
+                "seq": seq,
+                "count": 0,
+                "timer": self.loop.call_later(ACK_DELAY, self.send_ack_frame, conn),
+            }
+            conn.pending_ack = pending
+        pending["seq"] = seq
+        pending["arrived"] = time.time()
+        pending["count"] += 1
+
+        # Fora de ordem/duplicado (buraco ou ACK perdido) e fim de stream
+        # são confirmados na hora; o resto espera ACK_EVERY/ACK_DELAY.
+        if duplicate or not in_order or complete or pending["count"] >= ACK_EVERY:
+            self.send_ack_frame(conn)
+        else:
+            ack_ranges(conn)
+
+        if not complete or stream["done"]:
+            return
+        stream["done"] = True
+
+        if stream["kind"] == "msg":
+            print(f"[SERVIDOR] Stream {key} de mensagens completo ({received} mensagens)")
+            return
+
+        self.disk_reserved -= stream["limit"]
+        # Fechamento (fsync/rename/MD5) fora do loop, sem pausar a recepção
+        future = self.loop.run_in_executor(
+            None, finish_output,
+            stream["fd"], stream["tmp"], stream["output"], stream["end"],
+        )
+        future.add_done_callback(
+            lambda f, name=stream["output"]: print(
+                f"[SERVIDOR] Arquivo reconstruído como {name} (md5={f.result()})"
+            )
+        )
+
+    def handle_legacy_chunk(self, conn, stream, seq, chunk_bytes):
+        """Cliente antigo (sem base/offset): chunks em memória e ack_chunk por seq."""
+        duplicate = seq in stream["chunks"]
+        if not duplicate:
+            if conn.mem_used + len(chunk_bytes) > CONN_MEM_BUDGET:
+                print(f"  -> [BUDGET] conexão {conn.addr} conn_id={conn.conn_id} acima de "
+                      f"{CONN_MEM_BUDGET} bytes; descartando chunk seq={seq}")
+                return
+            conn.mem_used += len(chunk_bytes)
+            stream["chunks"][seq] = chunk_bytes
+        received = len(stream["chunks"])
+
+        print(f"[SERVIDOR] Recebido chunk seq={seq} do arquivo {stream['name']} "
+              f"({received}/{stream['total']})")
 
         # Envia ACK específico
         ack = {
             "type": "ack_chunk",
             "seq": seq
         }
-        sock.sendto(json.dumps(ack).encode(), addr)
+        self.send(ack, conn.addr)
 
-        # Se completou todos os chunks, reconstrói
-        if len(file_info["chunks"]) == file_info["total"]:
-            rebuild_file(filename, file_info)
+        if received != stream["total"] or duplicate or stream["done"]:
+            return
+        stream["done"] = True
 
-        # Já tratamos este tipo de pacote, volta pro início do loop
-        continue
+        # Reconstrói a partir da memória e libera os chunks
+        rebuild_file(stream["output"], stream)
+        conn.mem_used -= sum(len(c) for c in stream["chunks"].values())
+        stream["chunks"] = dict.fromkeys(stream["chunks"], b"")
 
 
-    response = {
-        "type": "ack",
-        "seq": seq,
-        "info": f"ack-from-server (delay={delay:.3f}s)"
-    }
-    resp_bytes = json.dumps(response).encode()
-    sock.sendto(resp_bytes, addr)
+async def main():
+    loop = asyncio.get_running_loop()
+    transport, protocol = await loop.create_datagram_endpoint(
+        QuicSimServerProtocol,
+        local_addr=(HOST, PORT),
+    )
 
-    print(f"  -> [SEND] ACK seq={seq} para {addr} (delay={delay:.3f}s)")
+    print(f"[SERVIDOR] QUIC-sim escutando em {HOST}:{PORT}")
+    print(f"[SERVIDOR] LOSS_PROB={LOSS_PROB}, MAX_DELAY={MAX_DELAY}s")
+    print(f"[SERVIDOR] DELAY_MODEL={DELAY_MODEL}, LOSS_MODEL={LOSS_MODEL}")
+
+    try:
+        await protocol.evict_idle()
+    finally:
+        transport.close()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass